@@ -25,6 +25,12 @@ setup(
     install_requires=[
         'requests',
     ],
+    extras_require={
+        'fast': ['orjson'],
+    },
+    entry_points={
+        'console_scripts': ['cloudreve=cloudreve.cli:main'],
+    },
     classifiers=[
         'Development Status :: 5 - Production/Stable',
         'Intended Audience :: Developers',
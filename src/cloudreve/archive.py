@@ -0,0 +1,297 @@
+import tarfile
+import threading
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from queue import Empty, Full, Queue
+from typing import Iterator, List
+
+from .entries import Entry
+from .tree import normalize_path, relative_path, walk
+from .utils import STREAM_CHUNK_SIZE, ensure_pool_size
+from .v4 import CloudreveV4
+
+FORMATS = ('tar', 'tar.gz', 'zip')
+
+
+class _Pipe:
+    '''
+    单个文件的有界数据管道，下载线程写入，归档线程按顺序读取
+    '''
+    _END = object()
+
+    def __init__(self, size, stop: threading.Event):
+        self.queue = Queue(size)
+        self.stop = stop
+        self.error = None
+        self.buffer = b''
+
+    def put(self, item):
+        while not self.stop.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return
+            except Full:
+                pass
+
+    def close(self, error=None):
+        self.error = error
+        self.put(self._END)
+
+    def chunks(self) -> Iterator[bytes]:
+        if self.buffer:
+            yield self.buffer
+            self.buffer = b''
+        while True:
+            try:
+                item = self.queue.get(timeout=0.1)
+            except Empty:
+                if self.stop.is_set():
+                    raise RuntimeError('导出已取消')
+                continue
+            if item is self._END:
+                if self.error is not None:
+                    raise self.error
+                return
+            yield item
+
+    def read(self, size=-1) -> bytes:
+        # 供tarfile.addfile使用
+        data = [self.buffer]
+        length = len(self.buffer)
+        self.buffer = b''
+        if size is None or size < 0:
+            data.extend(self.chunks())
+            return b''.join(data)
+        chunks = self.chunks()
+        while length < size:
+            chunk = next(chunks, None)
+            if chunk is None:
+                break
+            data.append(chunk)
+            length += len(chunk)
+        data = b''.join(data)
+        self.buffer = data[size:]
+        return data[:size]
+
+
+class _QueueWriter:
+    '''
+    将写入的数据放入队列，供iter_archive以生成器形式输出
+    '''
+
+    def __init__(self, queue: Queue, stop: threading.Event):
+        self.queue = queue
+        self.stop = stop
+
+    def put(self, item) -> bool:
+        while not self.stop.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return True
+            except Full:
+                pass
+        return False
+
+    def write(self, data):
+        if data and not self.put(bytes(data)):
+            raise RuntimeError('导出已取消')
+        return len(data)
+
+    def flush(self):
+        pass
+
+
+class ArchiveExporter:
+    '''
+    将远程目录以流的形式导出为tar或zip归档
+
+    多个文件并发下载，每个文件的数据经有界管道按顺序写入归档，
+    内存占用约为workers * buffer_chunks * STREAM_CHUNK_SIZE，不使用本地磁盘。
+    '''
+
+    def __init__(self, client, workers=4, buffer_chunks=16):
+        '''
+        @param client(Cloudreve|CloudreveV4): 客户端
+        @param workers: 同时下载的文件数
+        @param buffer_chunks: 每个文件最多缓冲的数据块数（每块64KB）
+        '''
+        self.client = client
+        self.workers = workers
+        self.buffer_chunks = buffer_chunks
+        self.is_v4 = isinstance(client, CloudreveV4)
+        ensure_pool_size(client.session, workers)
+
+    def collect(self, root) -> List[Entry]:
+        '''
+        列出root下的所有条目，按路径排序
+        @param root: 远程目录
+        @return: 条目列表（包含文件夹）
+        '''
+        entries = []
+        for _, items in walk(self.client, root, self.workers):
+            entries.extend(items)
+        entries.sort(key=lambda i: i.path)
+        return entries
+
+    def _fetch(self, entry: Entry, pipe: _Pipe):
+        try:
+            if self.is_v4:
+                url = self.client.get_download_url(entry.path)
+            else:
+                url = self.client.get_download_url(entry.id)
+            with self.client.session.get(url, stream=True) as r:
+                r.raise_for_status()
+                for chunk in r.iter_content(STREAM_CHUNK_SIZE):
+                    if pipe.stop.is_set():
+                        return
+                    if chunk:
+                        pipe.put(chunk)
+            pipe.close()
+        except Exception as e:
+            pipe.close(e)
+
+    def export(self, root, sink, format='tar', stop: threading.Event = None):
+        '''
+        导出远程目录
+        @param root: 远程目录
+        @param sink(str|file): 输出文件路径，或任意具有write方法的对象（如socket.makefile('wb')）
+        @param format: tar、tar.gz或zip
+        @param stop(threading.Event|None): 取消事件，由其他线程设置后下载线程尽快退出，导出以异常结束；导出结束时该事件也会被设置
+        @return: 写入归档的条目数
+        '''
+        assert format in FORMATS, f'不支持的归档格式 {format}'
+        if isinstance(sink, str):
+            with open(sink, 'wb') as f:
+                return self.export(root, f, format, stop)
+
+        root = normalize_path(self.client, root)
+        entries = [i for i in self.collect(root) if i.path != root]
+        files = [i for i in entries if not i.is_dir]
+
+        stop = stop or threading.Event()
+        pipes = {}
+        with ThreadPoolExecutor(max(1, self.workers)) as pool:
+            submitted = 0
+
+            def submit_until(limit):
+                # 进行中的文件数不超过workers，保证每个已提交的任务都能立即执行
+                nonlocal submitted
+                while submitted < min(limit, len(files)):
+                    entry = files[submitted]
+                    pipes[entry.path] = _Pipe(self.buffer_chunks, stop)
+                    pool.submit(self._fetch, entry, pipes[entry.path])
+                    submitted += 1
+
+            try:
+                if format == 'zip':
+                    archive = zipfile.ZipFile(sink, 'w',
+                                              zipfile.ZIP_DEFLATED)
+                else:
+                    mode = 'w|gz' if format == 'tar.gz' else 'w|'
+                    archive = tarfile.open(fileobj=sink, mode=mode)
+
+                with archive:
+                    done = 0
+                    for entry in entries:
+                        name = relative_path(root, entry.path)
+                        mtime = entry.updated_at or time.time()
+                        if entry.is_dir:
+                            self._add_dir(archive, name, mtime)
+                            continue
+                        submit_until(done + self.workers)
+                        pipe = pipes.pop(entry.path)
+                        self._add_file(archive, name, mtime, entry.size, pipe)
+                        done += 1
+            finally:
+                stop.set()
+        return len(entries)
+
+    def _add_dir(self, archive, name, mtime):
+        if isinstance(archive, zipfile.ZipFile):
+            info = zipfile.ZipInfo(name + '/',
+                                   time.localtime(max(mtime, 315532800))[:6])
+            archive.writestr(info, b'')
+        else:
+            info = tarfile.TarInfo(name)
+            info.type = tarfile.DIRTYPE
+            info.mode = 0o755
+            info.mtime = int(mtime)
+            archive.addfile(info)
+
+    def _add_file(self, archive, name, mtime, size, pipe: _Pipe):
+        if isinstance(archive, zipfile.ZipFile):
+            info = zipfile.ZipInfo(name,
+                                   time.localtime(max(mtime, 315532800))[:6])
+            info.compress_type = zipfile.ZIP_DEFLATED
+            info.file_size = size
+            with archive.open(info, 'w', force_zip64=size >= 1 << 31) as f:
+                for chunk in pipe.chunks():
+                    f.write(chunk)
+        else:
+            info = tarfile.TarInfo(name)
+            info.size = size
+            info.mode = 0o644
+            info.mtime = int(mtime)
+            archive.addfile(info, pipe)
+
+
+def export_archive(client, root, sink, format='tar', workers=4) -> int:
+    '''
+    将远程目录导出为归档文件或写入流
+    @param client(Cloudreve|CloudreveV4): 客户端
+    @param root: 远程目录
+    @param sink(str|file): 输出文件路径或可写对象
+    @param format: tar、tar.gz或zip
+    @param workers: 同时下载的文件数
+    @return: 写入归档的条目数
+    '''
+    return ArchiveExporter(client, workers).export(root, sink, format)
+
+
+def iter_archive(client, root, format='tar', workers=4,
+                 buffer_chunks=16) -> Iterator[bytes]:
+    '''
+    以生成器形式输出归档数据，适合直接作为HTTP响应体等场景
+    @param client(Cloudreve|CloudreveV4): 客户端
+    @param root: 远程目录
+    @param format: tar、tar.gz或zip
+    @param workers: 同时下载的文件数
+    @param buffer_chunks: 缓冲的数据块数
+    @return: 字节块迭代器
+    '''
+    queue = Queue(buffer_chunks)
+    stop = threading.Event()
+    writer = _QueueWriter(queue, stop)
+    end = object()
+    error = []
+
+    def run():
+        try:
+            ArchiveExporter(client, workers,
+                            buffer_chunks).export(root, writer, format, stop)
+        except BaseException as e:
+            error.append(e)
+        finally:
+            # export结束时会设置stop，此处不能使用writer.put；调用方取消时会持续取出数据直到本线程退出
+            queue.put(end)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    try:
+        while True:
+            chunk = queue.get()
+            if chunk is end:
+                break
+            yield chunk
+    finally:
+        # 调用方提前结束（如客户端断开、调用close()）时通知导出线程与下载线程退出
+        stop.set()
+        while thread.is_alive():
+            try:
+                queue.get(timeout=0.1)
+            except Empty:
+                pass
+        thread.join()
+    if error:
+        raise error[0]
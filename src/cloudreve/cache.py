@@ -0,0 +1,171 @@
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from inspect import signature
+
+
+class _Flight:
+    __slots__ = ('event', 'value', 'error')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+
+    def wait(self):
+        self.event.wait()
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+
+def _covers(a: str, b: str) -> bool:
+    # a是b本身或b的上级目录
+    a = a.rstrip('/')
+    return b == a or b.startswith(a + '/')
+
+
+class ReadCache:
+    '''
+    读接口的短时缓存
+
+    相同参数的并发请求只会发出一次，其余线程等待并共享结果；结果在ttl秒内直接从缓存返回。
+    通过同一客户端执行的写操作会按路径前缀清除相关缓存（路径本身、其上级目录与下级内容）。
+    请注意：缓存返回的是同一对象，调用方不应修改；每个客户端应使用独立的缓存实例。
+    '''
+
+    def __init__(self, ttl=5, max_entries=1024):
+        '''
+        @param ttl: 缓存有效期（秒）
+        @param max_entries: 最多缓存的结果数，超出后淘汰最久未使用的结果
+        '''
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._flights = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def get(self, key, path, loader):
+        '''
+        读取缓存，未命中时调用loader加载
+        @param key: 缓存键
+        @param path(str|None): 结果对应的路径，用于按前缀失效；None表示无法确定路径，任何写操作都会使其失效
+        @param loader: 无参数的加载函数
+        '''
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                return entry[2]
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                generation = self._generation
+
+        if not leader:
+            return flight.wait()
+
+        try:
+            value = loader()
+        except BaseException as e:
+            flight.error = e
+            with self._lock:
+                del self._flights[key]
+            flight.event.set()
+            raise
+
+        with self._lock:
+            del self._flights[key]
+            # 加载期间发生过写操作时结果可能已过时，不写入缓存
+            if generation == self._generation:
+                self._entries[key] = (time.monotonic() + self.ttl, path, value)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        flight.value = value
+        flight.event.set()
+        return value
+
+    def invalidate(self, paths=None):
+        '''
+        清除缓存
+        @param paths(list|None): 发生变化的路径列表，None表示清除全部
+        '''
+        with self._lock:
+            self._generation += 1
+            if paths is None:
+                self._entries.clear()
+                return
+            for key in [
+                    k for k, (_, path, _) in self._entries.items()
+                    if path is None or any(
+                        _covers(path, i) or _covers(i, path) for i in paths)
+            ]:
+                del self._entries[key]
+
+    def clear(self):
+        self.invalidate()
+
+
+def cached_read(normalize=None):
+    '''
+    读方法装饰器，客户端设置了read_cache时启用缓存
+    @param normalize(callable|None): 将方法第一个参数转换为规范路径的函数；None表示该方法以文件ID为参数
+    '''
+
+    def decorator(func):
+        sig = signature(func)
+
+        @wraps(func)
+        def wrapper(self, *args, **kwargs):
+            cache = self.read_cache
+            if cache is None:
+                return func(self, *args, **kwargs)
+            path = None
+            if normalize is not None:
+                bound = sig.bind(self, *args, **kwargs)
+                bound.apply_defaults()
+                path = normalize(list(bound.arguments.values())[1])
+            key = repr((func.__name__, args, sorted(kwargs.items())))
+            return cache.get(key, path, lambda: func(self, *args, **kwargs))
+
+        return wrapper
+
+    return decorator
+
+
+def invalidates(*names, normalize=None):
+    '''
+    写方法装饰器，执行后按参数中的路径清除缓存
+    @param names: 表示路径的参数名，参数值可为字符串或列表；不提供时清除全部缓存
+    @param normalize(callable|None): 路径规范化函数
+    '''
+
+    def decorator(func):
+        sig = signature(func)
+
+        @wraps(func)
+        def wrapper(self, *args, **kwargs):
+            try:
+                return func(self, *args, **kwargs)
+            finally:
+                cache = self.read_cache
+                if cache is not None:
+                    paths = None
+                    if names:
+                        bound = sig.bind(self, *args, **kwargs)
+                        paths = []
+                        for name in names:
+                            value = bound.arguments.get(name)
+                            values = value if type(value) is list else [value]
+                            paths.extend(
+                                normalize(i) if normalize else i
+                                for i in values if i)
+                    cache.invalidate(paths)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,494 @@
+'''
+cloudreve命令行工具
+
+    cloudreve --url http://127.0.0.1:5212 ls -l remote:/photos
+    cloudreve cp -r ./photos remote:/photos
+    cloudreve cp -r remote:/photos ./photos --resume
+    cloudreve sync ./photos remote:/photos
+    cloudreve rm -r remote:/tmp
+    cloudreve du --depth 1 remote:/
+
+远程路径以remote:开头（V4也可以直接使用cloudreve://开头的URI），其余参数视为本地路径。
+来源为目录时，cp -r与sync复制的是目录中的内容（与rsync src/ dst相同），而不是目录本身：
+cp -r remote:/a remote:/b得到/b/x而不是/b/a/x，上传、下载同理。
+站点地址、邮箱和密码也可以通过环境变量CLOUDREVE_URL、CLOUDREVE_EMAIL、CLOUDREVE_PASSWORD提供。
+'''
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime
+from fnmatch import fnmatchcase
+
+from .credentials import CredentialCache
+from .entries import Entry
+from .pool import PooledCloudreve, PooledCloudreveV4
+from .transfer import BulkTransfer, iter_local_pairs
+from .tree import TreeOperation, normalize_path, relative_path, walk
+from .usage import UsageReporter
+from .utils import RateLimiter, parse_size
+from .v3 import Cloudreve
+from .v4 import CloudreveV4
+
+REMOTE_PREFIX = 'remote:'
+
+
+class Output:
+    '''
+    结果输出，--json时每行输出一个JSON对象，否则输出便于阅读的文本
+    '''
+
+    def __init__(self, json_lines=False, stream=None):
+        self.json_lines = json_lines
+        self.stream = stream or sys.stdout
+
+    def emit(self, record: dict, text: str):
+        if self.json_lines:
+            self.stream.write(json.dumps(record, ensure_ascii=False) + '\n')
+        else:
+            self.stream.write(text + '\n')
+        self.stream.flush()
+
+
+def remote_path(value):
+    '''
+    解析命令行中的远程路径
+    @return: 远程路径，value不是远程路径时返回None
+    '''
+    if value.startswith(REMOTE_PREFIX):
+        return value[len(REMOTE_PREFIX):] or '/'
+    if value.startswith('cloudreve://'):
+        return value
+    return None
+
+
+def require_remote(value):
+    path = remote_path(value)
+    if path is None:
+        raise SystemExit(f'{value} 不是远程路径（需以{REMOTE_PREFIX}开头）')
+    return path
+
+
+def display_path(path):
+    # V4的URI显示为普通路径
+    if path.startswith('cloudreve://my'):
+        return path[len('cloudreve://my'):] or '/'
+    return path
+
+
+def format_size(size):
+    for unit in ('B', 'K', 'M', 'G', 'T'):
+        if size < 1024 or unit == 'T':
+            return f'{size:.0f}{unit}' if unit == 'B' else f'{size:.1f}{unit}'
+        size /= 1024
+
+
+def stat(client, path):
+    '''
+    获取远程条目，不存在时返回None
+    '''
+    path = normalize_path(client, path)
+    if path == normalize_path(client, '/'):
+        return Entry(None, '', path, 0, True, 0, 0)
+    try:
+        return client.get_entry(path)
+    except Exception:
+        return None
+
+
+def create_client(args):
+    urls = [i for i in (args.url or '').split(',') if i]
+    if not urls:
+        raise SystemExit('请通过--url或环境变量CLOUDREVE_URL提供站点地址。')
+    if not (args.email and args.password):
+        raise SystemExit('请通过--email/--password或环境变量CLOUDREVE_EMAIL、'
+                         'CLOUDREVE_PASSWORD提供登录信息。')
+
+    kwargs = {'verify': not args.insecure}
+    if not args.no_cache:
+        kwargs['credential_cache'] = CredentialCache()
+    if len(urls) > 1:
+        cls = PooledCloudreveV4 if args.api == 4 else PooledCloudreve
+        client = cls(urls, **kwargs)
+    else:
+        cls = CloudreveV4 if args.api == 4 else Cloudreve
+        client = cls(urls[0], **kwargs)
+
+    if args.limit_rate:
+        client.rate_limiter = RateLimiter(parse_size(args.limit_rate))
+    client.upload_prefetch = max(2, args.chunk_workers)
+    client.upload_retries = args.retries
+    client.login(args.email, args.password)
+    return client
+
+
+def entry_record(entry: Entry) -> dict:
+    return {
+        'path': display_path(entry.path),
+        'name': entry.name,
+        'id': entry.id,
+        'size': entry.size,
+        'is_dir': entry.is_dir,
+        'updated_at': entry.updated_at,
+    }
+
+
+def print_entry(out: Output, entry: Entry, long=False):
+    text = display_path(entry.path) + ('/' if entry.is_dir else '')
+    if long:
+        mtime = datetime.fromtimestamp(entry.updated_at).strftime(
+            '%Y-%m-%d %H:%M') if entry.updated_at else '-'
+        text = (f"{'d' if entry.is_dir else '-'} "
+                f'{entry.size or 0:>12} {mtime} {text}')
+    out.emit(entry_record(entry), text)
+
+
+def report_transfers(out: Output, action, results, started) -> int:
+    failed = 0
+    size = 0
+    for result in results:
+        if not result.ok:
+            failed += 1
+        elif os.path.isfile(result.local):
+            size += os.path.getsize(result.local)
+        remote = result.remote
+        if isinstance(remote, str):
+            remote = display_path(remote)
+        record = {
+            'action': action,
+            'local': str(result.local),
+            'remote': remote,
+            'ok': result.ok,
+            'error': None if result.ok else str(result.error),
+            'elapsed': round(result.elapsed, 3),
+        }
+        if result.ok:
+            text = f'{action}: {result.local} <-> {remote}'
+        else:
+            text = (f'{action} failed: {result.local} <-> {remote}: '
+                    f'{result.error}')
+        out.emit(record, text)
+
+    elapsed = time.monotonic() - started
+    out.emit(
+        {
+            'action': 'summary',
+            'files': len(results),
+            'failed': failed,
+            'bytes': size,
+            'elapsed': round(elapsed, 3),
+        }, f'{len(results) - failed}/{len(results)} files, '
+        f'{format_size(size)} in {elapsed:.1f}s '
+        f'({format_size(size / max(elapsed, 1e-6))}/s)')
+    return 1 if failed else 0
+
+
+def bulk(client, args, resume=False) -> BulkTransfer:
+    return BulkTransfer(client,
+                        workers=args.workers,
+                        resume=resume,
+                        part_workers=args.chunk_workers,
+                        part_size=parse_size(args.part_size))
+
+
+def remote_sizes(client, path, workers=8):
+    '''
+    返回远程文件（或目录下所有文件）的规范路径 -> 大小
+    '''
+    entry = stat(client, path)
+    if entry is None:
+        return {}
+    if not entry.is_dir:
+        return {entry.path: entry.size}
+    sizes = {}
+    for _, items in walk(client, entry.path, workers):
+        sizes.update((i.path, i.size) for i in items if not i.is_dir)
+    return sizes
+
+
+def download_pairs(client, root: Entry, dst, workers=8, skip_existing=False):
+    '''
+    生成下载对(本地路径, 远程文件, 大小)
+    @param skip_existing: 跳过本地已存在且大小一致的文件
+    '''
+    is_v4 = isinstance(client, CloudreveV4)
+    if root.is_dir:
+        entries = []
+        for _, items in walk(client, root.path, workers):
+            entries.extend(i for i in items if not i.is_dir)
+    else:
+        entries = [root]
+
+    for entry in entries:
+        if root.is_dir:
+            rel = relative_path(root.path, entry.path)
+            local = os.path.join(dst, *rel.split('/'))
+        elif os.path.isdir(dst) or dst.endswith(os.sep):
+            local = os.path.join(dst, entry.name)
+        else:
+            local = dst
+        if skip_existing and os.path.isfile(local) and os.path.getsize(
+                local) == entry.size:
+            continue
+        yield local, entry.path if is_v4 else entry.id, entry.size
+
+
+def upload_pairs(client, src, dst, workers=8, skip_existing=False):
+    '''
+    生成上传对(本地路径, 远程路径)
+    @param skip_existing: 跳过远程已存在且大小一致的文件
+    '''
+    src = os.path.abspath(src)
+    if os.path.isdir(src):
+        pairs = list(iter_local_pairs(src, dst))
+    else:
+        if not dst.endswith('/'):
+            entry = stat(client, dst)
+            is_dir = entry is not None and entry.is_dir
+        if dst.endswith('/') or is_dir:
+            dst = dst.rstrip('/') + '/' + os.path.basename(src)
+        pairs = [(src, dst)]
+
+    if skip_existing and pairs:
+        sizes = remote_sizes(client, dst, workers)
+        pairs = [(local, remote) for local, remote in pairs
+                 if sizes.get(normalize_path(client, remote)) !=
+                 os.path.getsize(local)]
+    return pairs
+
+
+def cmd_ls(client, args, out: Output) -> int:
+    path = require_remote(args.path)
+    entry = stat(client, path)
+    if entry is None:
+        raise SystemExit(f'{args.path} 不存在')
+    if not entry.is_dir:
+        print_entry(out, entry, args.long)
+        return 0
+
+    if args.recursive:
+        # 并发遍历，目录的输出顺序不确定
+        for _, items in walk(client, entry.path, args.workers):
+            for item in sorted(items, key=lambda i: i.name):
+                print_entry(out, item, args.long)
+    else:
+        for item in client.iter_list(entry.path, as_entry=True):
+            print_entry(out, item, args.long)
+    return 0
+
+
+def cmd_cp(client, args, out: Output, sync=False) -> int:
+    src, dst = remote_path(args.src), remote_path(args.dst)
+    recursive = sync or args.recursive
+    started = time.monotonic()
+    transfer = bulk(client, args, args.resume)
+
+    if src is None and dst is None:
+        raise SystemExit('来源和目标至少有一个需要是远程路径。')
+
+    if src is None:
+        if not os.path.exists(args.src):
+            raise SystemExit(f'{args.src} 不存在')
+        if os.path.isdir(args.src) and not recursive:
+            raise SystemExit(f'{args.src} 是目录，请使用-r')
+        pairs = upload_pairs(client, args.src, dst, args.workers, sync)
+        return report_transfers(out, 'upload', transfer.upload(pairs),
+                                started)
+
+    entry = stat(client, src)
+    if entry is None:
+        raise SystemExit(f'{args.src} 不存在')
+    if entry.is_dir and not recursive:
+        raise SystemExit(f'{args.src} 是目录，请使用-r')
+
+    if dst is None:
+        pairs = download_pairs(client, entry, args.dst, args.workers, sync)
+        return report_transfers(out, 'download', transfer.download(pairs),
+                                started)
+
+    # 远程之间复制，由服务端完成
+    op = TreeOperation(client, args.workers)
+    if entry.is_dir:
+        batches = op.copy(entry.path, '*', dst, dirs=True)
+    else:
+        batches = op.run(op.plan('copy', [entry], None, dst))
+    failed = 0
+    for batch in batches:
+        failed += not batch.ok
+        for item in batch.entries:
+            out.emit(
+                {
+                    'action': 'copy',
+                    'src': display_path(item.path),
+                    'dst': display_path(batch.dst_dir),
+                    'ok': batch.ok,
+                    'error': None if batch.ok else str(batch.error),
+                }, f'copy: {display_path(item.path)} -> '
+                f'{display_path(batch.dst_dir)}' +
+                ('' if batch.ok else f': {batch.error}'))
+    return 1 if failed else 0
+
+
+def cmd_sync(client, args, out: Output) -> int:
+    if remote_path(args.src) is not None and remote_path(
+            args.dst) is not None:
+        raise SystemExit('sync仅支持本地与远程之间的单向同步。')
+    return cmd_cp(client, args, out, sync=True)
+
+
+def cmd_rm(client, args, out: Output) -> int:
+    path = require_remote(args.path)
+    op = TreeOperation(client, args.workers)
+
+    name = path[path.rfind('/') + 1:]
+    if any(i in name for i in '*?['):
+        parent = path[:path.rfind('/')] or '/'
+        entries = [
+            i for i in op.select(parent, '*', dirs=True)
+            if fnmatchcase(i.name, name)
+        ]
+    else:
+        entry = stat(client, path)
+        if entry is None:
+            raise SystemExit(f'{args.path} 不存在')
+        entries = [entry]
+
+    dirs = [i for i in entries if i.is_dir]
+    if dirs and not args.recursive:
+        raise SystemExit(f'{display_path(dirs[0].path)} 是目录，请使用-r')
+
+    failed = 0
+    for batch in op.run(op.plan('delete', entries)):
+        failed += not batch.ok
+        for item in batch.entries:
+            out.emit(
+                {
+                    'action': 'delete',
+                    'path': display_path(item.path),
+                    'ok': batch.ok,
+                    'error': None if batch.ok else str(batch.error),
+                }, f'delete: {display_path(item.path)}' +
+                ('' if batch.ok else f': {batch.error}'))
+    return 1 if failed else 0
+
+
+def cmd_du(client, args, out: Output) -> int:
+    path = require_remote(args.path)
+    reporter = UsageReporter(client,
+                             args.workers,
+                             trust_dir_mtime=not args.no_trust_mtime)
+    if args.cache and os.path.isfile(args.cache):
+        reporter.load(args.cache)
+    usage = reporter.report(path, args.depth)
+    if args.cache:
+        reporter.save(args.cache)
+
+    for key in sorted(usage, key=lambda i: (-len(i), i)):
+        item = usage[key]
+        record = item.to_dict()
+        record['path'] = display_path(item.path)
+        size = item.size if args.bytes else format_size(item.size)
+        out.emit(
+            record,
+            f'{size:>10}  {item.files:>8} files  {display_path(item.path)}')
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    env = os.environ.get
+    parser = argparse.ArgumentParser(
+        prog='cloudreve', description='Cloudreve命令行工具（支持V3与V4）')
+    parser.add_argument('--url',
+                        default=env('CLOUDREVE_URL'),
+                        help='站点地址，多个节点以逗号分隔')
+    parser.add_argument('--api',
+                        type=int,
+                        choices=(3, 4),
+                        default=int(env('CLOUDREVE_API', '4')),
+                        help='API版本（默认4）')
+    parser.add_argument('--email', default=env('CLOUDREVE_EMAIL'))
+    parser.add_argument('--password', default=env('CLOUDREVE_PASSWORD'))
+    parser.add_argument('--no-cache',
+                        action='store_true',
+                        help='不使用登录凭据缓存')
+    parser.add_argument('--insecure',
+                        action='store_true',
+                        help='不验证SSL证书')
+    parser.add_argument('-j',
+                        '--workers',
+                        type=int,
+                        default=8,
+                        help='并发处理的文件（目录）数')
+    parser.add_argument('--chunk-workers',
+                        type=int,
+                        default=4,
+                        help='单个大文件分段并发下载的连接数（上传时为预读分块数）')
+    parser.add_argument('--part-size',
+                        default='8M',
+                        help='分段下载时每段的大小')
+    parser.add_argument('--retries',
+                        type=int,
+                        default=3,
+                        help='上传分块失败时的重试次数')
+    parser.add_argument('--limit-rate', help='总带宽上限，如10M表示10MB/s')
+    parser.add_argument('--json',
+                        action='store_true',
+                        help='以JSON Lines格式输出')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    ls = commands.add_parser('ls', help='列出远程目录')
+    ls.add_argument('path', nargs='?', default=REMOTE_PREFIX + '/')
+    ls.add_argument('-r', '--recursive', action='store_true')
+    ls.add_argument('-l', '--long', action='store_true', help='显示大小和修改时间')
+
+    for name, help in (('cp', '上传、下载或在远程之间复制；来源为目录时复制其中的内容至目标目录'),
+                       ('sync', '单向同步，跳过目标中大小一致的文件')):
+        cp = commands.add_parser(name, help=help, description=help)
+        cp.add_argument('src')
+        cp.add_argument('dst')
+        cp.add_argument('-r',
+                        '--recursive',
+                        action='store_true',
+                        help='复制目录（sync总是递归）')
+        cp.add_argument('--resume',
+                        action='store_true',
+                        help='下载时从本地已有的部分继续')
+
+    rm = commands.add_parser('rm', help='删除远程文件，文件名支持通配符')
+    rm.add_argument('path')
+    rm.add_argument('-r', '--recursive', action='store_true')
+
+    du = commands.add_parser('du', help='统计远程目录用量')
+    du.add_argument('path', nargs='?', default=REMOTE_PREFIX + '/')
+    du.add_argument('-d', '--depth', type=int, default=None,
+                    help='通过列目录展开的层数，更深的部分由服务端统计')
+    du.add_argument('-b', '--bytes', action='store_true', help='以字节为单位显示')
+    du.add_argument('--cache', help='用量缓存文件，用于增量统计')
+    du.add_argument('--no-trust-mtime',
+                    action='store_true',
+                    help='不复用修改时间未变化的文件夹的缓存（见README“文件夹修改时间”一节）')
+    return parser
+
+
+COMMANDS = {
+    'ls': cmd_ls,
+    'cp': cmd_cp,
+    'sync': cmd_sync,
+    'rm': cmd_rm,
+    'du': cmd_du,
+}
+
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    out = Output(args.json)
+    client = create_client(args)
+    try:
+        return COMMANDS[args.command](client, args, out)
+    except KeyboardInterrupt:
+        return 130
+
+
+if __name__ == '__main__':
+    sys.exit(main())
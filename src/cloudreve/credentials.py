@@ -0,0 +1,134 @@
+import json
+import os
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+
+def default_cache_path() -> Path:
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(
+        os.path.expanduser('~'), '.cache')
+    return Path(base) / 'cloudreve' / 'credentials.json'
+
+
+def _lock_file(fd):
+    '''
+    以非阻塞方式对文件加排他锁，锁已被占用时抛出OSError
+    '''
+    if fcntl is not None:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    else:
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+
+
+def _unlock_file(fd):
+    if fcntl is not None:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+    else:
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+
+
+class CredentialCache:
+    '''
+    登录凭据的磁盘缓存
+
+    多个进程共享同一缓存文件：读写均在文件锁内进行，写入通过临时文件原子替换，
+    使新进程可以直接复用未过期的会话，而不必每次都调用登录接口。
+    '''
+
+    def __init__(self,
+                 path=None,
+                 lock_timeout=30,
+                 margin=60,
+                 default_ttl=7 * 86400):
+        '''
+        @param path(str|Path|None): 缓存文件路径，默认为~/.cache/cloudreve/credentials.json
+        @param lock_timeout(int): 等待文件锁的最长时间（秒），超时抛出异常
+        @param margin(int): 凭据距离过期不足该秒数时视为已过期
+        @param default_ttl(int): 服务端未给出过期时间时（如V3会话Cookie）采用的有效期（秒）
+        '''
+        self.path = Path(path) if path is not None else default_cache_path()
+        self.lock_path = self.path.with_name(self.path.name + '.lock')
+        self.lock_timeout = lock_timeout
+        self.margin = margin
+        self.default_ttl = default_ttl
+
+    @contextmanager
+    def lock(self):
+        '''
+        获取跨进程文件锁
+
+        锁由操作系统维护（fcntl.flock / msvcrt.locking），持有锁的进程退出后自动释放，
+        因此不会残留锁，也不会删除其他进程仍持有的锁。
+        '''
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(self.lock_path, os.O_CREAT | os.O_RDWR, 0o600)
+        try:
+            deadline = time.monotonic() + self.lock_timeout
+            while True:
+                try:
+                    _lock_file(fd)
+                    break
+                except OSError:
+                    if time.monotonic() > deadline:
+                        raise Exception(
+                            f'timed out waiting for lock {self.lock_path}')
+                    time.sleep(0.05)
+            try:
+                yield
+            finally:
+                _unlock_file(fd)
+        finally:
+            os.close(fd)
+
+    def _read(self) -> dict:
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def _write(self, data: dict):
+        tmp = self.path.with_name(f'{self.path.name}.{os.getpid()}.tmp')
+        fd = os.open(tmp, os.O_CREAT | os.O_TRUNC | os.O_WRONLY, 0o600)
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+        os.replace(tmp, self.path)
+
+    def valid(self, expires) -> bool:
+        '''
+        判断过期时间戳是否仍然有效
+        @param expires(float|None): 过期时间戳
+        '''
+        return bool(expires) and expires - self.margin > time.time()
+
+    def get(self, key):
+        '''
+        读取凭据（调用方需自行持有锁）
+        @param key: 凭据键，通常为站点地址和用户名的组合
+        @return: 凭据字典，不存在时返回None
+        '''
+        return self._read().get(key)
+
+    def set(self, key, value):
+        '''
+        写入凭据（调用方需自行持有锁），同时清理已完全过期的条目
+        @param key: 凭据键
+        @param value(dict|None): 凭据字典，为None时删除该键
+        '''
+        data = self._read()
+        if value is None:
+            data.pop(key, None)
+        else:
+            data[key] = value
+        now = time.time()
+        data = {k: v for k, v in data.items() if v.get('expires', 0) > now}
+        self._write(data)
@@ -0,0 +1,256 @@
+from array import array
+from itertools import compress
+from typing import Callable, Iterable, Iterator, List, Union
+
+from .utils import parse_time
+
+
+def join_path(parent: str, name: str) -> str:
+    if parent.endswith('/'):
+        return parent + name
+    return parent + '/' + name
+
+
+class Entry:
+    '''
+    文件或文件夹条目
+
+    使用__slots__保存常用字段，内存占用远小于接口返回的原始字典。
+    - id: 文件ID
+    - name: 文件名
+    - path: 完整路径（V3为/开头的路径，V4为cloudreve://开头的URI）
+    - size: 文件大小（文件夹为0）
+    - is_dir: 是否为文件夹
+    - created_at: 创建时间戳
+    - updated_at: 修改时间戳
+    - raw: 原始字典（仅在keep_raw=True时保留，否则为None）
+    '''
+    __slots__ = ('id', 'name', 'path', 'size', 'is_dir', 'created_at',
+                 'updated_at', 'raw')
+
+    def __init__(self,
+                 id,
+                 name,
+                 path,
+                 size=0,
+                 is_dir=False,
+                 created_at=0.0,
+                 updated_at=0.0,
+                 raw=None):
+        self.id = id
+        self.name = name
+        self.path = path
+        self.size = size
+        self.is_dir = is_dir
+        self.created_at = created_at
+        self.updated_at = updated_at
+        self.raw = raw
+
+    @classmethod
+    def from_v3(cls, obj: dict, keep_raw=False) -> 'Entry':
+        '''
+        由V3 list接口返回的objects列表项构造条目
+        '''
+        return cls(obj['id'], obj['name'], join_path(obj['path'],
+                                                     obj['name']),
+                   obj.get('size', 0), obj['type'] == 'dir',
+                   parse_time(obj.get('create_date')),
+                   parse_time(obj.get('date')), obj if keep_raw else None)
+
+    @classmethod
+    def from_v4(cls, obj: dict, keep_raw=False) -> 'Entry':
+        '''
+        由V4 list/info接口返回的文件信息构造条目
+        '''
+        return cls(obj.get('id'), obj['name'], obj['path'],
+                   obj.get('size', 0), obj['type'] == 1,
+                   parse_time(obj.get('created_at')),
+                   parse_time(obj.get('updated_at')),
+                   obj if keep_raw else None)
+
+    @property
+    def parent(self) -> str:
+        return self.path[:self.path.rfind('/')] or '/'
+
+    def __repr__(self):
+        kind = 'dir' if self.is_dir else 'file'
+        return f'Entry({kind} {self.path!r}, size={self.size})'
+
+
+class Policy:
+    '''
+    存储策略
+    - id: 存储策略ID
+    - name: 名称
+    - type: 类型，如local、onedrive、remote
+    - max_size: 单文件大小限制（0表示不限制）
+    - raw: 原始字典（仅在keep_raw=True时保留）
+    '''
+    __slots__ = ('id', 'name', 'type', 'max_size', 'raw')
+
+    def __init__(self, id, name, type, max_size=0, raw=None):
+        self.id = id
+        self.name = name
+        self.type = type
+        self.max_size = max_size
+        self.raw = raw
+
+    @classmethod
+    def from_dict(cls, obj: dict, keep_raw=False) -> 'Policy':
+        return cls(obj.get('id'), obj.get('name'), obj.get('type'),
+                   obj.get('max_size', 0), obj if keep_raw else None)
+
+    def __repr__(self):
+        return f'Policy({self.name!r}, type={self.type!r})'
+
+
+class Listing:
+    '''
+    目录列表
+
+    条目在迭代或索引时才由原始数据构造；调用compact()或to_columns()后可丢弃原始数据。
+    - parent: 目录完整路径
+    - policy: 目录存储策略（Policy）
+    '''
+
+    def __init__(self,
+                 parent: str,
+                 objects: List[dict],
+                 factory: Callable[..., Entry],
+                 policy: Union[Policy, None] = None,
+                 keep_raw=False):
+        self.parent = parent
+        self.policy = policy
+        self._objects = objects
+        self._factory = factory
+        self._keep_raw = keep_raw
+        self._entries = None
+
+    def _build(self, obj) -> Entry:
+        return self._factory(obj, self._keep_raw)
+
+    def compact(self) -> 'Listing':
+        '''
+        一次性构造所有条目并丢弃原始数据
+        '''
+        if self._entries is None:
+            self._entries = [self._build(i) for i in self._objects]
+            self._objects = None
+        return self
+
+    def __len__(self):
+        if self._entries is not None:
+            return len(self._entries)
+        return len(self._objects)
+
+    def __getitem__(self, index) -> Entry:
+        if self._entries is not None:
+            return self._entries[index]
+        return self._build(self._objects[index])
+
+    def __iter__(self) -> Iterator[Entry]:
+        if self._entries is not None:
+            return iter(self._entries)
+        return (self._build(i) for i in self._objects)
+
+    @property
+    def files(self) -> List[Entry]:
+        return [i for i in self if not i.is_dir]
+
+    @property
+    def dirs(self) -> List[Entry]:
+        return [i for i in self if i.is_dir]
+
+    def to_columns(self) -> 'ColumnarListing':
+        return ColumnarListing(self)
+
+    def __repr__(self):
+        return f'Listing({self.parent!r}, {len(self)} entries)'
+
+
+class ColumnarListing:
+    '''
+    列式存储的条目集合
+
+    大小与时间戳保存在紧凑的array中，适合对整棵目录树的快照做批量筛选：
+
+        big = cols.select(cols.mask(lambda size, updated_at: size > 1 << 30))
+
+    - ids、names、paths: 字符串列表
+    - sizes: array('q')
+    - created_at、updated_at: array('d')
+    - is_dir: bytearray，1表示文件夹
+    '''
+
+    def __init__(self, entries: Iterable[Entry] = ()):
+        self.ids = []
+        self.names = []
+        self.paths = []
+        self.sizes = array('q')
+        self.created_at = array('d')
+        self.updated_at = array('d')
+        self.is_dir = bytearray()
+        self.extend(entries)
+
+    def append(self, entry: Entry):
+        self.ids.append(entry.id)
+        self.names.append(entry.name)
+        self.paths.append(entry.path)
+        self.sizes.append(entry.size or 0)
+        self.created_at.append(entry.created_at)
+        self.updated_at.append(entry.updated_at)
+        self.is_dir.append(1 if entry.is_dir else 0)
+
+    def extend(self, entries: Iterable[Entry]):
+        for i in entries:
+            self.append(i)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, index) -> Entry:
+        return Entry(self.ids[index], self.names[index], self.paths[index],
+                     self.sizes[index], bool(self.is_dir[index]),
+                     self.created_at[index], self.updated_at[index])
+
+    def __iter__(self) -> Iterator[Entry]:
+        return (self[i] for i in range(len(self)))
+
+    def mask(self, predicate: Callable[[int, float], bool]) -> bytearray:
+        '''
+        按大小和修改时间生成筛选掩码
+        @param predicate: 接收(size, updated_at)并返回bool的函数
+        @return: 掩码，1表示保留
+        '''
+        return bytearray(map(predicate, self.sizes, self.updated_at))
+
+    def select(self, mask) -> 'ColumnarListing':
+        '''
+        按掩码筛选出新的集合
+        @param mask: 与条目数等长的可迭代对象，真值表示保留
+        '''
+        result = ColumnarListing()
+        mask = bytes(bool(i) for i in mask)
+        result.ids = list(compress(self.ids, mask))
+        result.names = list(compress(self.names, mask))
+        result.paths = list(compress(self.paths, mask))
+        result.sizes = array('q', compress(self.sizes, mask))
+        result.created_at = array('d', compress(self.created_at, mask))
+        result.updated_at = array('d', compress(self.updated_at, mask))
+        result.is_dir = bytearray(compress(self.is_dir, mask))
+        return result
+
+    def files_only(self) -> 'ColumnarListing':
+        return self.select(i ^ 1 for i in self.is_dir)
+
+    def larger_than(self, size: int) -> 'ColumnarListing':
+        return self.select(self.mask(lambda s, _: s > size))
+
+    def modified_since(self, timestamp: float) -> 'ColumnarListing':
+        return self.select(self.mask(lambda _, t: t >= timestamp))
+
+    def total_size(self) -> int:
+        return sum(self.sizes)
+
+    def __repr__(self):
+        return f'ColumnarListing({len(self)} entries)'
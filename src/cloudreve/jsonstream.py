@@ -0,0 +1,71 @@
+import codecs
+import json
+import re
+from typing import Iterable, Iterator
+
+from .utils import json_loads
+
+_decoder = json.JSONDecoder()
+_separator = re.compile(r'[\s,]*')
+_terminators = frozenset(' \t\r\n,]')
+
+
+def iter_json_array(chunks: Iterable[bytes],
+                    key: str,
+                    document: dict = None) -> Iterator:
+    '''
+    从分块到达的JSON文本中逐个解析指定数组的元素，无需等待完整响应下载完毕
+    @param chunks: 字节块迭代器，如Response.iter_content()
+    @param key: 数组对应的键名，如objects、files
+    @param document(dict|None): 若提供，迭代结束后填入去掉该数组元素后的完整文档（含code、分页等信息）
+    若文档中不存在该数组（如接口返回错误），则不产生任何元素，document中为完整文档
+    '''
+    chunks = iter(chunks)
+    text = codecs.getincrementaldecoder('utf-8')()
+    start = re.compile(r'(?<!\\)"%s"\s*:\s*\[' % re.escape(key))
+    buf = ''
+    done = False
+
+    while True:
+        chunk = next(chunks, None)
+        if chunk is None:
+            buf += text.decode(b'', True)
+            if document is not None:
+                document.update(json_loads(buf))
+            return
+        buf += text.decode(chunk)
+        m = start.search(buf)
+        if m:
+            prefix, buf = buf[:m.end()], buf[m.end():]
+            break
+
+    pos = 0
+    while True:
+        pos = _separator.match(buf, pos).end()
+        if pos < len(buf):
+            if buf[pos] == ']':
+                break
+            try:
+                value, end = _decoder.raw_decode(buf, pos)
+            except ValueError:
+                end = None
+            # 元素之后须紧跟分隔符或数组结尾，否则可能是被分块截断的数字（如1500.|0），需等待更多数据
+            if end is not None and end < len(buf) and buf[end] in _terminators:
+                yield value
+                pos = end
+                continue
+        if done:
+            raise ValueError(f'Incomplete JSON array "{key}"')
+        chunk = next(chunks, None)
+        if chunk is None:
+            buf = buf[pos:] + text.decode(b'', True)
+            done = True
+        else:
+            buf = buf[pos:] + text.decode(chunk)
+        pos = 0
+
+    if document is not None:
+        rest = [buf[pos:]]
+        rest.extend(text.decode(i) for i in chunks)
+        rest.append(text.decode(b'', True))
+        document.update(json_loads(prefix + ''.join(rest)))
@@ -0,0 +1,262 @@
+import threading
+import time
+from typing import List
+
+from requests.exceptions import ConnectionError, ConnectTimeout, Timeout
+from urllib3.exceptions import NewConnectionError
+
+from .v3 import Cloudreve
+from .v4 import CloudreveV4
+
+
+class Endpoint:
+    '''
+    单个节点的健康状态
+    - base_url: 节点接口地址
+    - latency: 平均响应时间（秒，指数加权）
+    - requests: 请求总数
+    - errors: 失败总数
+    - error_rate: 错误率（指数加权）
+    - in_flight: 进行中的请求数
+    - down_until: 节点被暂时摘除的截止时间
+    '''
+    __slots__ = ('base_url', 'latency', 'requests', 'errors', 'error_rate',
+                 'in_flight', 'down_until')
+
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.latency = 0.0
+        self.requests = 0
+        self.errors = 0
+        self.error_rate = 0.0
+        self.in_flight = 0
+        self.down_until = 0.0
+
+    @property
+    def available(self) -> bool:
+        return self.down_until <= time.monotonic()
+
+    def score(self) -> float:
+        '''
+        负载评分，越小越优先
+        '''
+        return (self.latency or 0.001) * (1 + self.in_flight) * (
+            1 + 10 * self.error_rate)
+
+    def __repr__(self):
+        return (f'Endpoint({self.base_url!r}, latency={self.latency:.3f}, '
+                f'error_rate={self.error_rate:.2f}, '
+                f'in_flight={self.in_flight})')
+
+
+def never_sent(e: Exception) -> bool:
+    '''
+    判断请求是否在建立连接阶段就已失败（此时任何请求方法都可以安全重试）
+    '''
+    if isinstance(e, ConnectTimeout):
+        return True
+    reason = getattr(e.args[0], 'reason', None) if e.args else None
+    return isinstance(reason, NewConnectionError)
+
+
+class EndpointPool:
+    '''
+    节点池，记录各节点的延迟与错误率并选择最优节点
+    '''
+
+    def __init__(self, base_urls: List[str], cooldown=30, smoothing=0.2):
+        '''
+        @param base_urls: 节点接口地址列表
+        @param cooldown: 节点出错后被暂时摘除的秒数
+        @param smoothing: 延迟与错误率的指数加权系数
+        '''
+        assert base_urls, '至少需要一个节点地址。'
+        self.endpoints = [Endpoint(i) for i in base_urls]
+        self.cooldown = cooldown
+        self.smoothing = smoothing
+        self._lock = threading.Lock()
+
+    def acquire(self, exclude=()) -> Endpoint:
+        '''
+        选择一个节点并将其进行中请求数加一
+        @param exclude: 本次请求中已经失败过的节点
+        '''
+        with self._lock:
+            candidates = [i for i in self.endpoints if i not in exclude]
+            if not candidates:
+                raise LookupError('没有可用的节点')
+            healthy = [i for i in candidates if i.available] or candidates
+            endpoint = min(healthy, key=Endpoint.score)
+            endpoint.in_flight += 1
+            return endpoint
+
+    def best(self) -> Endpoint:
+        '''
+        返回当前最优节点（不计入进行中请求）
+        '''
+        with self._lock:
+            healthy = [i for i in self.endpoints if i.available
+                       ] or self.endpoints
+            return min(healthy, key=Endpoint.score)
+
+    def release(self, endpoint: Endpoint, elapsed: float, ok: bool):
+        '''
+        记录一次请求的结果
+        @param endpoint: 节点
+        @param elapsed: 耗时（秒）
+        @param ok: 是否成功
+        '''
+        a = self.smoothing
+        with self._lock:
+            endpoint.in_flight -= 1
+            endpoint.requests += 1
+            endpoint.error_rate = (1 - a) * endpoint.error_rate + a * (not ok)
+            if ok:
+                endpoint.latency = elapsed if not endpoint.latency else (
+                    1 - a) * endpoint.latency + a * elapsed
+                # 请求（或健康检查）成功说明节点已恢复，提前结束摘除
+                endpoint.down_until = 0.0
+            else:
+                endpoint.errors += 1
+                endpoint.down_until = time.monotonic() + self.cooldown
+
+
+class PooledMixin:
+    '''
+    多节点客户端的公共实现，需与Cloudreve或CloudreveV4组合使用
+
+    每次请求选择延迟、负载与错误率综合最优的节点；幂等请求遇到连接错误、
+    超时或5xx响应时自动切换到其他节点重试，其他请求仅在连接未建立时重试。
+    '''
+
+    def __init__(self,
+                 base_urls: List[str],
+                 *args,
+                 retry_methods=('GET', 'HEAD', 'OPTIONS'),
+                 cooldown=30,
+                 **kwargs):
+        '''
+        @param base_urls(list): 节点地址列表，第一个节点为主节点
+        @param retry_methods: 失败时允许切换节点重试的请求方法，如需对签发下载链接等请求重试，可加入PUT、POST
+        @param cooldown: 节点出错后被暂时摘除的秒数
+        其余参数与Cloudreve/CloudreveV4相同
+        '''
+        super().__init__(base_urls[0], *args, **kwargs)
+        suffix = self._base_url[self._base_url.rfind('/api/'):]
+        urls = []
+        for url in base_urls:
+            url = url.rstrip('/')
+            if not url.endswith(suffix):
+                url += suffix
+            urls.append(url)
+        self.pool = EndpointPool(urls, cooldown)
+        self.retry_methods = {i.upper() for i in retry_methods}
+        self._health_thread = None
+        self._health_stop = threading.Event()
+
+    @property
+    def base_url(self):
+        # 拼接相对下载链接等场景优先使用主节点（第一个节点），主节点不可用时使用当前最优节点
+        pool = self.__dict__.get('pool')
+        if pool is None or pool.endpoints[0].available:
+            return self._base_url
+        return pool.best().base_url
+
+    @base_url.setter
+    def base_url(self, value):
+        self._base_url = value
+
+    def _cookies(self):
+        # Cookie按域名保存，切换节点时需要显式携带会话Cookie
+        for cookie in self.session.cookies:
+            if cookie.name == 'cloudreve-session':
+                return {'cloudreve-session': cookie.value}
+        return None
+
+    def send(self, method, url, **kwargs):
+        cookies = self._cookies()
+        if cookies and 'cookies' not in kwargs:
+            kwargs['cookies'] = cookies
+
+        retry = method.upper() in self.retry_methods
+        tried = []
+        while True:
+            endpoint = self.pool.acquire(tried)
+            tried.append(endpoint)
+            start = time.monotonic()
+            ok = False
+            try:
+                r = self.session.request(method, endpoint.base_url + url,
+                                         **kwargs)
+                ok = r.status_code < 500
+            except (ConnectionError, Timeout) as e:
+                if not (retry or never_sent(e)) or len(tried) == len(
+                        self.pool.endpoints):
+                    raise
+                continue
+            finally:
+                # 其他异常（如请求参数错误）也需要释放节点，避免进行中请求数泄漏
+                self.pool.release(endpoint, time.monotonic() - start, ok)
+
+            if ok or not retry or len(tried) == len(self.pool.endpoints):
+                return r
+            r.close()
+
+    def check_health(self, timeout=5):
+        '''
+        向所有节点发送/site/ping请求，更新节点状态
+        @param timeout: 超时时间（秒）
+        @return: 节点列表
+        '''
+        for endpoint in self.pool.endpoints:
+            with self.pool._lock:
+                endpoint.in_flight += 1
+            start = time.monotonic()
+            ok = False
+            try:
+                r = self.session.get(endpoint.base_url + '/site/ping',
+                                     timeout=timeout)
+                ok = r.status_code < 500
+            except (ConnectionError, Timeout):
+                pass
+            finally:
+                self.pool.release(endpoint, time.monotonic() - start, ok)
+        return self.pool.endpoints
+
+    def start_health_checks(self, interval=30):
+        '''
+        启动后台健康检查线程
+        @param interval: 检查间隔（秒）
+        '''
+        if self._health_thread is not None:
+            return
+        self._health_stop.clear()
+
+        def loop():
+            while not self._health_stop.wait(interval):
+                self.check_health()
+
+        self._health_thread = threading.Thread(target=loop, daemon=True)
+        self._health_thread.start()
+
+    def stop_health_checks(self):
+        '''
+        停止后台健康检查线程
+        '''
+        if self._health_thread is None:
+            return
+        self._health_stop.set()
+        self._health_thread.join()
+        self._health_thread = None
+
+
+class PooledCloudreve(PooledMixin, Cloudreve):
+    '''
+    连接多个节点的Cloudreve V3客户端
+    '''
+
+
+class PooledCloudreveV4(PooledMixin, CloudreveV4):
+    '''
+    连接多个节点的Cloudreve V4客户端
+    '''
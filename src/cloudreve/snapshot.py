@@ -0,0 +1,162 @@
+import json
+import time
+from typing import Dict, List, Tuple
+
+from .entries import Entry
+from .tree import normalize_path, walk
+
+
+class Snapshot:
+    '''
+    远程目录树的快照
+
+    每个条目仅保存(id, size, updated_at, is_dir)元组，以路径为键。
+    - root: 快照的起始目录
+    - taken_at: 拍摄时间戳
+    - entries: 路径 -> (id, size, updated_at, is_dir)
+    '''
+
+    def __init__(self, root, entries: Dict[str, Tuple] = None, taken_at=None):
+        self.root = root
+        self.entries = entries if entries is not None else {}
+        self.taken_at = taken_at if taken_at is not None else time.time()
+        self._children = None
+
+    def add(self, entry: Entry):
+        self.entries[entry.path] = (entry.id, entry.size or 0,
+                                    entry.updated_at, entry.is_dir)
+
+    def children(self) -> Dict[str, List[str]]:
+        '''
+        返回文件夹路径 -> 直接下级路径列表
+        '''
+        if self._children is None:
+            children = {}
+            for path in self.entries:
+                children.setdefault(path[:path.rfind('/')] or '/',
+                                    []).append(path)
+            self._children = children
+        return self._children
+
+    def subtree(self, path) -> List[str]:
+        '''
+        返回文件夹下所有下级条目的路径（不含文件夹本身）
+        '''
+        children = self.children()
+        result = []
+        stack = [path]
+        while stack:
+            for child in children.get(stack.pop(), ()):
+                result.append(child)
+                if self.entries[child][3]:
+                    stack.append(child)
+        return result
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, path):
+        return path in self.entries
+
+    def save(self, file):
+        '''
+        保存快照至文件
+        @param file: 文件路径
+        '''
+        with open(file, 'w', encoding='utf-8') as f:
+            json.dump(
+                {
+                    'root': self.root,
+                    'taken_at': self.taken_at,
+                    'entries': [[k, *v] for k, v in self.entries.items()],
+                }, f)
+
+    @classmethod
+    def load(cls, file) -> 'Snapshot':
+        '''
+        从文件加载快照
+        @param file: 文件路径
+        '''
+        with open(file, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        entries = {i[0]: tuple(i[1:]) for i in data['entries']}
+        return cls(data['root'], entries, data['taken_at'])
+
+    def __repr__(self):
+        return f'Snapshot({self.root!r}, {len(self)} entries)'
+
+
+class Changes:
+    '''
+    两次快照之间的变化
+    - added: 新增的路径
+    - removed: 删除的路径
+    - modified: 大小、修改时间或ID发生变化的文件路径
+    '''
+    __slots__ = ('added', 'removed', 'modified')
+
+    def __init__(self, added, removed, modified):
+        self.added = added
+        self.removed = removed
+        self.modified = modified
+
+    def __bool__(self):
+        return bool(self.added or self.removed or self.modified)
+
+    def __repr__(self):
+        return (f'Changes(added={len(self.added)}, '
+                f'removed={len(self.removed)}, '
+                f'modified={len(self.modified)})')
+
+
+def take_snapshot(client,
+                  root='/',
+                  previous: Snapshot = None,
+                  workers=8,
+                  trust_dir_mtime=True) -> Snapshot:
+    '''
+    拍摄远程目录树快照
+    @param client(Cloudreve|CloudreveV4): 客户端
+    @param root: 起始目录
+    @param previous(Snapshot|None): 上一次的快照
+    @param workers: 并发列目录数
+    @param trust_dir_mtime: 提供previous时，修改时间未变化的文件夹直接复用上一次快照中的整棵子树，不再列出
+    （局限见README“文件夹修改时间”一节）
+    @return: Snapshot
+    '''
+    root = normalize_path(client, root)
+    snapshot = Snapshot(root)
+    reused = []
+
+    def prune(entry: Entry):
+        if previous is None or not trust_dir_mtime:
+            return False
+        old = previous.entries.get(entry.path)
+        if old is not None and old[3] and old[2] == entry.updated_at:
+            reused.append(entry.path)
+            return True
+        return False
+
+    for _, entries in walk(client, root, workers, prune):
+        for entry in entries:
+            snapshot.add(entry)
+
+    for path in reused:
+        for child in previous.subtree(path):
+            snapshot.entries[child] = previous.entries[child]
+    return snapshot
+
+
+def diff(old: Snapshot, new: Snapshot) -> Changes:
+    '''
+    比较两次快照
+    @param old: 旧快照
+    @param new: 新快照
+    @return: Changes，各列表按路径排序
+    '''
+    added = sorted(i for i in new.entries if i not in old.entries)
+    removed = sorted(i for i in old.entries if i not in new.entries)
+    modified = sorted(
+        path for path, value in new.entries.items()
+        if not value[3] and path in old.entries and old.entries[path] != value)
+    return Changes(added, removed, modified)
@@ -0,0 +1,230 @@
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from itertools import islice
+from pathlib import Path
+from typing import Iterable, Iterator, List, Tuple
+
+from .tree import ensure_dirs, normalize_path
+from .utils import download_file, download_file_parallel, ensure_pool_size
+from .v4 import CloudreveV4
+
+
+class TransferResult:
+    '''
+    单个文件的传输结果
+    - local: 本地文件路径
+    - remote: 远程路径（V3上传为路径、下载为文件ID；V4为URI）
+    - error: 异常，传输成功时为None
+    - elapsed: 耗时（秒）
+    '''
+    __slots__ = ('local', 'remote', 'error', 'elapsed')
+
+    def __init__(self, local, remote, error=None, elapsed=0.0):
+        self.local = local
+        self.remote = remote
+        self.error = error
+        self.elapsed = elapsed
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+    def __repr__(self):
+        status = 'ok' if self.ok else f'error={self.error!r}'
+        return f'TransferResult({self.local!r}, {self.remote!r}, {status})'
+
+
+def iter_local_pairs(local_dir, remote_dir) -> Iterator[Tuple[str, str]]:
+    '''
+    遍历本地目录，生成用于批量上传的(本地路径, 远程路径)对
+    @param local_dir: 本地目录
+    @param remote_dir: 远程目标目录
+    '''
+    local_dir = Path(local_dir)
+    remote_dir = remote_dir.rstrip('/')
+    for root, _, files in os.walk(local_dir):
+        rel = Path(root).relative_to(local_dir).as_posix()
+        prefix = remote_dir if rel == '.' else f'{remote_dir}/{rel}'
+        for name in files:
+            yield os.path.join(root, name), f'{prefix}/{name}'
+
+
+class BulkTransfer:
+    '''
+    批量上传/下载管理器
+
+    上传会话与下载链接由准备线程提前创建，传输线程池中同时进行的文件数量受限，
+    结果按输入顺序返回。同一目录的存储策略只查询一次，V4下载链接按批获取。
+    上传时不存在的远程目录（包括上级目录）会被自动创建。
+    '''
+
+    def __init__(self,
+                 client,
+                 workers=8,
+                 prefetch=None,
+                 batch_size=50,
+                 verify=False,
+                 resume=False,
+                 part_workers=1,
+                 part_size=8 << 20):
+        '''
+        @param client(Cloudreve|CloudreveV4): 已登录的客户端
+        @param workers(int): 并发传输的文件数
+        @param prefetch(int|None): 提前准备（创建会话、获取链接）的文件数，默认与workers相同
+        @param batch_size(int): V4批量获取下载链接时每批的文件数
+        @param verify(bool): 下载时是否按Content-Length校验大小并续传不完整的部分
+        @param resume(bool): 下载时本地已存在部分数据则从断点继续
+        @param part_workers(int): 单个大文件分段并发下载的连接数（需在下载对中提供文件大小）
+        @param part_size(int): 分段下载时每段的大小
+        '''
+        self.client = client
+        self.verify = verify
+        self.resume = resume
+        self.part_workers = part_workers
+        self.part_size = part_size
+        self.workers = workers
+        self.prefetch = workers if prefetch is None else prefetch
+        self.batch_size = batch_size
+        self.is_v4 = isinstance(client, CloudreveV4)
+        # 目录 -> Future，每个目录的存储策略只由一个线程查询，其他目录的查询不受影响
+        self._policies = {}
+        self._policy_lock = threading.Lock()
+        ensure_pool_size(client.session,
+                         workers * max(1, part_workers) + self.prefetch)
+
+    def _load_policy(self, remote_dir):
+        try:
+            return self.client.get_policy(remote_dir)
+        except Exception:
+            # 目录尚不存在，创建后重新查询
+            ensure_dirs(self.client, [remote_dir])
+            return self.client.get_policy(remote_dir)
+
+    def _policy(self, remote_dir):
+        with self._policy_lock:
+            future = self._policies.get(remote_dir)
+            owner = future is None
+            if owner:
+                future = self._policies[remote_dir] = Future()
+        if owner:
+            try:
+                future.set_result(self._load_policy(remote_dir))
+            except Exception as e:
+                # 失败的结果不缓存，之后的文件会重新查询
+                with self._policy_lock:
+                    del self._policies[remote_dir]
+                future.set_exception(e)
+        return future.result()
+
+    def _prepare_upload(self, batch):
+        sessions = []
+        for local, remote in batch:
+            remote = normalize_path(self.client, remote)
+            remote_dir = remote[:remote.rfind('/')] or '/'
+            if self.is_v4:
+                policy = self._policy(remote_dir)
+                sessions.append(
+                    self.client.create_upload_session(local, remote, policy))
+            else:
+                policy_id, policy_type = self._policy(remote_dir)
+                sessions.append(
+                    self.client.create_upload_session(remote, local,
+                                                      policy_id,
+                                                      policy_type))
+        return sessions
+
+    def _execute_upload(self, item, prepared):
+        upload_session, policy_type = prepared
+        self.client.upload_with_session(item[0], upload_session, policy_type)
+
+    def _download_url(self, remote):
+        try:
+            if self.is_v4:
+                return self.client.get_download_urls([remote])[0]
+            return self.client.get_download_url(remote)
+        except Exception as e:
+            return e
+
+    def _prepare_download(self, batch):
+        remotes = [item[1] for item in batch]
+        if self.is_v4 and len(remotes) > 1:
+            try:
+                return self.client.get_download_urls(remotes)
+            except Exception:
+                # 批次中任一文件不存在或无权限都会使整批失败，改为逐个获取
+                pass
+        return [self._download_url(i) for i in remotes]
+
+    def _execute_download(self, item, prepared):
+        local = Path(item[0])
+        local.parent.mkdir(parents=True, exist_ok=True)
+        size = item[2] if len(item) > 2 else None
+        limiter = self.client.rate_limiter
+        if size is None or self.part_workers <= 1 or (self.resume
+                                                      and local.is_file()):
+            # 已知大小时总是校验，保证续传的结果完整
+            download_file(prepared,
+                          str(local),
+                          self.client.session,
+                          self.verify or size is not None,
+                          size,
+                          resume=self.resume,
+                          rate_limiter=limiter)
+        else:
+            download_file_parallel(prepared, str(local), size,
+                                   self.client.session, self.part_workers,
+                                   self.part_size, rate_limiter=limiter)
+
+    def _run(self, items, prepare, execute, batch_size):
+        window = threading.BoundedSemaphore(self.workers + self.prefetch)
+        futures = []
+
+        def task(item, batch_future, index):
+            start = time.monotonic()
+            try:
+                prepared = batch_future.result()[index]
+                if isinstance(prepared, Exception):
+                    raise prepared
+                execute(item, prepared)
+                error = None
+            except Exception as e:
+                error = e
+            finally:
+                window.release()
+            return TransferResult(item[0], item[1], error,
+                                  time.monotonic() - start)
+
+        items = iter(items)
+        with ThreadPoolExecutor(max(1, self.prefetch)) as prep_pool, \
+                ThreadPoolExecutor(self.workers) as pool:
+            while True:
+                batch = list(islice(items, batch_size))
+                if not batch:
+                    break
+                batch_future = prep_pool.submit(prepare, batch)
+                for index, item in enumerate(batch):
+                    window.acquire()
+                    futures.append(
+                        pool.submit(task, item, batch_future, index))
+        return [f.result() for f in futures]
+
+    def upload(self, pairs: Iterable[Tuple[str, str]]) -> List[TransferResult]:
+        '''
+        批量上传文件
+        @param pairs: (本地路径, 远程路径)对，远程路径包含文件名，所在目录不存在时会自动创建
+        @return: 按输入顺序排列的传输结果列表
+        '''
+        return self._run(pairs, self._prepare_upload, self._execute_upload, 1)
+
+    def download(self,
+                 pairs: Iterable[Tuple[str, str]]) -> List[TransferResult]:
+        '''
+        批量下载文件
+        @param pairs: (本地保存路径, 远程文件)对，V3为文件ID，V4为文件URI；可追加第三项文件大小，用于校验、续传与分段下载
+        @return: 按输入顺序排列的传输结果列表
+        '''
+        batch_size = self.batch_size if self.is_v4 else 1
+        return self._run(pairs, self._prepare_download,
+                         self._execute_download, batch_size)
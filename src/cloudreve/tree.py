@@ -0,0 +1,297 @@
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from fnmatch import fnmatchcase
+from typing import Callable, Iterator, List, Tuple, Union
+
+from . import v3, v4
+from .entries import Entry
+
+
+def normalize_path(client, path: str) -> str:
+    '''
+    将路径转换为客户端条目中使用的形式（V3为/开头的路径，V4为cloudreve://开头的URI）
+    '''
+    if isinstance(client, v4.CloudreveV4):
+        return v4.revise_file_path(path).rstrip('/')
+    return v3.revise_file_path(path) or '/'
+
+
+def relative_path(root: str, path: str) -> str:
+    '''
+    返回path相对于root的路径，root本身返回空字符串
+    '''
+    if path == root:
+        return ''
+    return path[len(root.rstrip('/')) + 1:]
+
+
+def ensure_dirs(client, dirs):
+    '''
+    创建远程目录，包括不存在的上级目录
+    @param client(Cloudreve|CloudreveV4): 客户端
+    @param dirs: 目录路径列表
+    '''
+    root = normalize_path(client, '/')
+    wanted = set()
+    for dir in dirs:
+        dir = normalize_path(client, dir)
+        while dir != root and dir.startswith(root) and dir not in wanted:
+            wanted.add(dir)
+            dir = dir[:dir.rfind('/')] or '/'
+    for dir in sorted(wanted):
+        if isinstance(client, v4.CloudreveV4):
+            client.create_folder(dir)
+        else:
+            try:
+                client.create_dir(dir)
+            except Exception:
+                # 目录已存在；其他错误会在后续操作中暴露
+                pass
+
+
+def prune_nested(entries: List[Entry]) -> List[Entry]:
+    '''
+    去掉上级文件夹同样在列表中的条目（复制、移动或删除文件夹时会连同内容一起处理）
+    '''
+    dirs = {i.path for i in entries if i.is_dir}
+    result = []
+    for entry in entries:
+        path = entry.path
+        while path.rfind('/') > 0:
+            path = path[:path.rfind('/')]
+            if path in dirs:
+                break
+        else:
+            result.append(entry)
+    return result
+
+
+def list_dir(client, path: str) -> List[Entry]:
+    '''
+    列出目录下的全部条目（V4自动翻页）
+    '''
+    if isinstance(client, v4.CloudreveV4):
+        return list(client.iter_list(path, as_entry=True))
+    return list(client.list_entries(path).compact())
+
+
+def walk(client,
+         root='/',
+         workers=8,
+         prune: Union[Callable[[Entry], bool], None] = None
+         ) -> Iterator[Tuple[str, List[Entry]]]:
+    '''
+    并发遍历远程目录树
+    @param client(Cloudreve|CloudreveV4): 客户端
+    @param root: 起始目录
+    @param workers: 同时列出的目录数
+    @param prune(callable|None): 接收文件夹条目，返回True时不进入该文件夹
+    @return: (目录路径, 目录下的条目列表)迭代器，目录的返回顺序不确定
+    '''
+    root = normalize_path(client, root)
+    with ThreadPoolExecutor(workers) as pool:
+        pending = {pool.submit(list_dir, client, root): root}
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                path = pending.pop(future)
+                entries = future.result()
+                for entry in entries:
+                    if entry.is_dir and not (prune and prune(entry)):
+                        pending[pool.submit(list_dir, client,
+                                            entry.path)] = entry.path
+                yield path, entries
+
+
+class Batch:
+    '''
+    一次批量操作
+    - action: copy、move或delete
+    - src_dir: 来源文件夹
+    - dst_dir: 目标目录（delete为None）
+    - entries: 操作的条目列表
+    - error: 执行失败时的异常
+    '''
+    __slots__ = ('action', 'src_dir', 'dst_dir', 'entries', 'error')
+
+    def __init__(self, action, src_dir, dst_dir, entries):
+        self.action = action
+        self.src_dir = src_dir
+        self.dst_dir = dst_dir
+        self.entries = entries
+        self.error = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+    def __repr__(self):
+        return (f'Batch({self.action} {len(self.entries)} entries '
+                f'{self.src_dir!r} -> {self.dst_dir!r})')
+
+
+class TreeOperation:
+    '''
+    目录树批量操作规划器
+
+    按通配符选出条目后，依据API的要求分组：V3的复制、移动需要同一来源文件夹，
+    V4的/file/move需要同一目标目录；各批次在线程池中并发执行。
+    V3的复制接口每次只能复制一个对象，因此V3复制时每个批次只包含一个条目，
+    移动和删除仍按batch_size合并。
+    选中的文件夹作为整体操作，不再单独处理其下级条目。
+    '''
+
+    def __init__(self, client, workers=8, batch_size=100):
+        '''
+        @param client(Cloudreve|CloudreveV4): 客户端
+        @param workers: 并发执行的批次数（同时用于遍历目录）
+        @param batch_size: 每批最多包含的条目数（V3复制固定为1）
+        '''
+        self.client = client
+        self.workers = workers
+        self.batch_size = batch_size
+        self.is_v4 = isinstance(client, v4.CloudreveV4)
+
+    def select(self, root, patterns='*', dirs=False) -> List[Entry]:
+        '''
+        选出root下相对路径匹配通配符的条目
+        @param root: 起始目录
+        @param patterns(str|list): 通配符，匹配相对于root的路径，*可以匹配/，如*.jpg、photos/2023/*
+        @param dirs: 是否允许选中文件夹（选中后不再进入其下级）
+        @return: 条目列表
+        '''
+        if type(patterns) is str:
+            patterns = [patterns]
+        root = normalize_path(self.client, root)
+
+        def match(entry):
+            rel = relative_path(root, entry.path)
+            return any(fnmatchcase(rel, i) for i in patterns)
+
+        def prune(entry):
+            return dirs and match(entry)
+
+        selected = []
+        for _, entries in walk(self.client, root, self.workers, prune):
+            for entry in entries:
+                if entry.is_dir and not dirs:
+                    continue
+                if match(entry):
+                    selected.append(entry)
+        return selected
+
+    def plan(self, action, entries: List[Entry], root=None,
+             dst_root=None) -> List[Batch]:
+        '''
+        将条目分组为批次
+        @param action: copy、move或delete
+        @param entries: 条目列表，上级文件夹同样在列表中的条目会被忽略
+        @param root: 来源根目录，提供后目标目录中会保留相对于root的目录结构
+        @param dst_root: 目标根目录（delete不需要）
+        @return: 批次列表
+        '''
+        assert action in ('copy', 'move', 'delete'), f'不支持的操作 {action}'
+        assert action == 'delete' or dst_root, '复制和移动需要提供目标目录。'
+        if root is not None:
+            root = normalize_path(self.client, root)
+        if dst_root is not None:
+            dst_root = normalize_path(self.client, dst_root)
+
+        groups = {}
+        for entry in prune_nested(entries):
+            src_dir = entry.parent
+            dst_dir = None
+            if action != 'delete':
+                dst_dir = dst_root
+                if root is not None:
+                    rel = relative_path(root, src_dir)
+                    if rel:
+                        dst_dir = dst_root.rstrip('/') + '/' + rel
+            if self.is_v4 or action == 'delete':
+                # V4按目标目录分组；删除操作不需要来源文件夹
+                key = (None, dst_dir)
+            else:
+                key = (src_dir, dst_dir)
+            groups.setdefault(key, []).append(entry)
+
+        batch_size = self.batch_size
+        if action == 'copy' and not self.is_v4:
+            # V3的复制接口拒绝包含多个对象的请求
+            batch_size = 1
+        batches = []
+        for (src_dir, dst_dir), group in groups.items():
+            for i in range(0, len(group), batch_size):
+                batches.append(
+                    Batch(action, src_dir, dst_dir, group[i:i + batch_size]))
+        return batches
+
+    def _create_dirs(self, batches: List[Batch]):
+        ensure_dirs(self.client, {i.dst_dir for i in batches if i.dst_dir})
+
+    def _execute(self, batch: Batch):
+        client = self.client
+        if self.is_v4:
+            uris = [i.path for i in batch.entries]
+            if batch.action == 'delete':
+                client.delete(uris)
+            else:
+                client.copy_or_move(uris, batch.dst_dir,
+                                    batch.action == 'copy')
+            return
+
+        items = [i.id for i in batch.entries if not i.is_dir]
+        dirs = [i.id for i in batch.entries if i.is_dir]
+        if batch.action == 'delete':
+            client.batch_delete(items, dirs)
+        elif batch.action == 'copy':
+            client.batch_copy(batch.src_dir, items, dirs, batch.dst_dir)
+        else:
+            client.batch_move(batch.src_dir, items, dirs, batch.dst_dir)
+
+    def _run_batch(self, batch: Batch) -> Batch:
+        try:
+            self._execute(batch)
+        except Exception as e:
+            batch.error = e
+        return batch
+
+    def run(self, batches: List[Batch]) -> List[Batch]:
+        '''
+        并发执行批次，目标目录会预先创建
+        @param batches: plan返回的批次列表
+        @return: 批次列表，失败的批次error不为None
+        '''
+        self._create_dirs(batches)
+        with ThreadPoolExecutor(self.workers) as pool:
+            return list(pool.map(self._run_batch, batches))
+
+    def copy(self, root, patterns, dst_root, dirs=False) -> List[Batch]:
+        '''
+        复制root下匹配通配符的条目至dst_root，保留目录结构
+        @param root: 来源根目录
+        @param patterns(str|list): 通配符
+        @param dst_root: 目标根目录
+        @param dirs: 是否允许选中文件夹
+        '''
+        entries = self.select(root, patterns, dirs)
+        return self.run(self.plan('copy', entries, root, dst_root))
+
+    def move(self, root, patterns, dst_root, dirs=False) -> List[Batch]:
+        '''
+        移动root下匹配通配符的条目至dst_root，保留目录结构
+        @param root: 来源根目录
+        @param patterns(str|list): 通配符
+        @param dst_root: 目标根目录
+        @param dirs: 是否允许选中文件夹
+        '''
+        entries = self.select(root, patterns, dirs)
+        return self.run(self.plan('move', entries, root, dst_root))
+
+    def delete(self, root, patterns, dirs=False) -> List[Batch]:
+        '''
+        删除root下匹配通配符的条目
+        @param root: 来源根目录
+        @param patterns(str|list): 通配符
+        @param dirs: 是否允许选中文件夹
+        '''
+        entries = self.select(root, patterns, dirs)
+        return self.run(self.plan('delete', entries))
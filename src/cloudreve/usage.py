@@ -0,0 +1,197 @@
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+from .entries import Entry
+from .tree import list_dir, normalize_path
+from .v4 import CloudreveV4
+
+
+class DirUsage:
+    '''
+    文件夹用量（包含所有下级内容）
+    - path: 文件夹路径
+    - size: 总字节数
+    - files: 文件数
+    - folders: 文件夹数
+    '''
+    __slots__ = ('path', 'size', 'files', 'folders')
+
+    def __init__(self, path, size=0, files=0, folders=0):
+        self.path = path
+        self.size = size
+        self.files = files
+        self.folders = folders
+
+    def to_dict(self) -> dict:
+        return {
+            'path': self.path,
+            'size': self.size,
+            'files': self.files,
+            'folders': self.folders,
+        }
+
+    def __repr__(self):
+        return (f'DirUsage({self.path!r}, size={self.size}, '
+                f'files={self.files}, folders={self.folders})')
+
+
+class UsageReporter:
+    '''
+    文件夹用量统计
+
+    在depth层以内通过列目录统计（文件大小直接取自列表），depth层的文件夹通过
+    属性接口由服务端统计，所有请求并发执行。结果按文件夹修改时间缓存：再次统计时，
+    修改时间未变化的文件夹复用缓存，不再发出请求（局限见README“文件夹修改时间”一节）。
+    '''
+
+    def __init__(self, client, workers=8, max_age=None, trust_dir_mtime=True):
+        '''
+        @param client(Cloudreve|CloudreveV4): 客户端
+        @param workers: 并发请求数
+        @param max_age(int|None): 缓存最长复用时间（秒），None表示只要修改时间未变化就一直复用
+        @param trust_dir_mtime: 是否复用修改时间未变化的文件夹的缓存，为False时每次都重新请求（结果仍会写入缓存）
+        '''
+        self.client = client
+        self.workers = workers
+        self.max_age = max_age
+        self.trust_dir_mtime = trust_dir_mtime
+        self.is_v4 = isinstance(client, CloudreveV4)
+        # 路径 -> [修改时间, 缓存时间, 类型, 数据]
+        self.cache = {}
+
+    def _cached(self, entry: Entry, kind):
+        if entry is None or not self.trust_dir_mtime:
+            return None
+        item = self.cache.get(entry.path)
+        if item is None or item[2] != kind or item[0] != entry.updated_at:
+            return None
+        if self.max_age is not None and time.time() - item[1] > self.max_age:
+            return None
+        return item[3]
+
+    def _store(self, entry: Entry, kind, data):
+        if entry is not None:
+            self.cache[entry.path] = [entry.updated_at, time.time(), kind, data]
+
+    def _summary(self, entry: Entry) -> DirUsage:
+        data = self._cached(entry, 'summary')
+        if data is None:
+            if self.is_v4:
+                r = self.client.get_info(entry.path,
+                                         folder_summary=True)['folder_summary']
+                data = [r.get('size', 0), r.get('files', 0), r.get('folders', 0)]
+            else:
+                r = self.client.get_property(entry.id, is_dir=True)
+                data = [
+                    r.get('size', 0),
+                    r.get('child_file_num', 0),
+                    r.get('child_folder_num', 0)
+                ]
+            self._store(entry, 'summary', data)
+        return DirUsage(entry.path, *data)
+
+    def _listing(self, path, entry: Entry):
+        data = self._cached(entry, 'list')
+        if data is None:
+            entries = list_dir(self.client, path)
+            dirs = [i for i in entries if i.is_dir]
+            files = [i for i in entries if not i.is_dir]
+            data = [sum(i.size or 0 for i in files), len(files), dirs]
+            self._store(entry, 'list', data)
+        return data
+
+    def report(self, root='/', depth=None) -> Dict[str, DirUsage]:
+        '''
+        统计root及其下级文件夹的用量
+        @param root: 起始目录
+        @param depth(int|None): 通过列目录展开的层数，该层的文件夹改由服务端统计；None表示完全通过列目录统计
+        @return: 路径 -> DirUsage，包含root与展开范围内的所有文件夹
+        '''
+        root = normalize_path(self.client, root)
+        usage = {}
+        children = {}
+        # 每一层中展开（列出）的文件夹，用于自下而上汇总
+        expanded = []
+        level = [(root, None)]
+        current = 0
+
+        with ThreadPoolExecutor(self.workers) as pool:
+            while level:
+                summary = depth is not None and current >= depth
+                futures = []
+                for path, entry in level:
+                    if summary and entry is not None:
+                        futures.append(pool.submit(self._summary, entry))
+                    else:
+                        futures.append(pool.submit(self._listing, path, entry))
+
+                next_level = []
+                expanded.append([])
+                for (path, entry), future in zip(level, futures):
+                    result = future.result()
+                    if isinstance(result, DirUsage):
+                        usage[path] = result
+                        continue
+                    size, files, dirs = result
+                    usage[path] = DirUsage(path, size, files, len(dirs))
+                    children[path] = [i.path for i in dirs]
+                    expanded[-1].append(path)
+                    next_level.extend((i.path, i) for i in dirs)
+                level = next_level
+                current += 1
+
+        # 自下而上汇总，按遍历的层级而非路径中/的数量排序（V3根目录/与/a的/数量相同）
+        for path in (i for paths in reversed(expanded) for i in paths):
+            total = usage[path]
+            for child in children[path]:
+                sub = usage[child]
+                total.size += sub.size
+                total.files += sub.files
+                total.folders += sub.folders
+        return usage
+
+    def save(self, file):
+        '''
+        保存缓存至文件，供后续进程增量统计
+        @param file: 文件路径
+        '''
+        data = {}
+        for path, (updated_at, cached_at, kind, value) in self.cache.items():
+            if kind == 'list':
+                value = value[:2] + [[[
+                    i.id, i.name, i.path, i.updated_at
+                ] for i in value[2]]]
+            data[path] = [updated_at, cached_at, kind, value]
+        with open(file, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+
+    def load(self, file):
+        '''
+        从文件加载缓存
+        @param file: 文件路径
+        '''
+        with open(file, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        for path, (updated_at, cached_at, kind, value) in data.items():
+            if kind == 'list':
+                value = value[:2] + [[
+                    Entry(id, name, p, 0, True, 0.0, t)
+                    for id, name, p, t in value[2]
+                ]]
+            self.cache[path] = [updated_at, cached_at, kind, value]
+
+
+def usage_report(client, root='/', depth=None,
+                 workers=8) -> List[DirUsage]:
+    '''
+    统计文件夹用量的便捷函数
+    @param client(Cloudreve|CloudreveV4): 客户端
+    @param root: 起始目录
+    @param depth(int|None): 通过列目录展开的层数，见UsageReporter.report
+    @param workers: 并发请求数
+    @return: 按路径排序的DirUsage列表
+    '''
+    usage = UsageReporter(client, workers).report(root, depth)
+    return [usage[i] for i in sorted(usage)]
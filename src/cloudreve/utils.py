@@ -1,12 +1,415 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from queue import Empty, Full, Queue
+
 from requests import Session
+from requests.adapters import HTTPAdapter
+from requests.exceptions import ChunkedEncodingError
+from requests.exceptions import ConnectionError as RequestsConnectionError
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+STREAM_CHUNK_SIZE = 64 * 1024
+# 表示未登录或凭据已失效的错误码
+AUTH_ERROR_CODES = (401, )
+
+_json_loads = orjson.loads if orjson is not None else json.loads
+
+
+def json_loads(data):
+    '''
+    使用当前JSON后端解析数据
+    @param data(bytes|str): JSON文本
+    '''
+    return _json_loads(data)
+
+
+def set_json_backend(loads=None):
+    '''
+    设置解析响应所用的JSON后端（默认在安装了orjson时使用orjson，否则使用标准库json）
+    @param loads(callable|None): 接收bytes或str并返回Python对象的函数，为None时恢复默认后端
+    '''
+    global _json_loads
+    if loads is None:
+        loads = orjson.loads if orjson is not None else json.loads
+    _json_loads = loads
+
+
+_TIME_RE = re.compile(
+    r'^(\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}:\d{2})(\.\d+)?(Z|[+-]\d{2}:?\d{2})?$')
+
+
+class IntegrityError(Exception):
+    '''
+    传输完成后大小或校验和与预期不一致
+    '''
 
 
-def download_file(url: str, save_path: str, session: Session = None):
+class RateLimiter:
+    '''
+    令牌桶限速器，可在多个线程、多个传输之间共享
+    '''
+
+    def __init__(self, rate, burst=None):
+        '''
+        @param rate: 每秒允许的字节数
+        @param burst(int|None): 令牌桶容量，默认为一秒的流量
+        '''
+        self.rate = rate
+        self.burst = burst or rate
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def consume(self, size):
+        '''
+        消耗size字节的配额，不足时阻塞等待
+        @param size: 字节数
+        '''
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst,
+                              self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= size
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait > 0:
+            time.sleep(wait)
+
+
+def parse_size(value) -> int:
+    '''
+    将10M、512K、1.5G等写法转换为字节数
+    '''
+    if isinstance(value, (int, float)):
+        return int(value)
+    value = value.strip().upper().rstrip('B')
+    units = {'K': 1 << 10, 'M': 1 << 20, 'G': 1 << 30, 'T': 1 << 40}
+    if value and value[-1] in units:
+        return int(float(value[:-1]) * units[value[-1]])
+    return int(value)
+
+
+def download_file(url: str,
+                  save_path: str,
+                  session: Session = None,
+                  verify=False,
+                  expected_size=None,
+                  checksum=None,
+                  expected_checksum=None,
+                  retries=3,
+                  resume=False,
+                  rate_limiter: RateLimiter = None):
+    '''
+    下载文件
+    @param url: 下载链接
+    @param save_path: 保存路径
+    @param session: requests会话
+    @param verify: 是否校验大小；开启后连接中断或数据不完整时只续传缺失的部分
+    @param expected_size(int|None): 预期大小，未提供时使用响应的Content-Length
+    @param checksum(str|None): 下载过程中计算的校验和算法（hashlib名称）
+    @param expected_checksum(str|None): 预期的校验和（十六进制，需同时提供checksum），不一致时抛出IntegrityError
+    @param retries: 续传的最大次数
+    @param resume: 保存路径已存在时是否从已有数据之后继续下载
+    @param rate_limiter(RateLimiter|None): 限速器
+    @return: 提供checksum时返回校验和
+    '''
+    assert checksum or not expected_checksum, '提供expected_checksum时需同时提供checksum。'
     s = session or Session()
 
-    r = session.get(url, stream=True)
+    hasher = hashlib.new(checksum) if checksum else None
+    written = 0
+    if resume and os.path.isfile(save_path):
+        written = os.path.getsize(save_path)
+        if expected_size is not None and written > expected_size:
+            written = 0
+    if written and hasher is not None:
+        with open(save_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(STREAM_CHUNK_SIZE), b''):
+                hasher.update(chunk)
+
+    attempt = 0
+    with open(save_path, 'r+b' if written else 'wb') as f:
+        f.seek(written)
+        f.truncate()
+        while expected_size is None or written < expected_size:
+            headers = {'Range': f'bytes={written}-'} if written else {}
+            error = None
+            try:
+                with s.get(url, stream=True, headers=headers) as r:
+                    if written and r.status_code == 416:
+                        # 已有数据即为完整文件
+                        break
+                    if verify or written:
+                        r.raise_for_status()
+                    if written and r.status_code != 206:
+                        # 服务端不支持断点续传，只能从头开始
+                        f.seek(0)
+                        f.truncate()
+                        written = 0
+                        hasher = hashlib.new(checksum) if checksum else None
+                    length = r.headers.get('Content-Length')
+                    if expected_size is None and length is not None and (
+                            'Content-Encoding' not in r.headers):
+                        expected_size = written + int(length)
+                    for chunk in r.iter_content(chunk_size=STREAM_CHUNK_SIZE):
+                        if chunk:
+                            if rate_limiter is not None:
+                                rate_limiter.consume(len(chunk))
+                            f.write(chunk)
+                            if hasher is not None:
+                                hasher.update(chunk)
+                            written += len(chunk)
+            except (RequestsConnectionError, ChunkedEncodingError) as e:
+                error = e
+
+            if not verify or expected_size is None:
+                if error is not None:
+                    raise error
+                break
+            attempt += 1
+            if written < expected_size and attempt > retries:
+                break
+
+    if verify and expected_size is not None and written != expected_size:
+        raise IntegrityError(
+            f'{save_path}: 预期大小 {expected_size}，实际写入 {written}')
+    digest = hasher.hexdigest() if hasher is not None else None
+    if expected_checksum and digest != expected_checksum.lower():
+        raise IntegrityError(
+            f'{save_path}: 校验和不一致（预期 {expected_checksum}，实际 {digest}）')
+    return digest
+
+
+def download_file_parallel(url: str,
+                           save_path: str,
+                           size: int,
+                           session: Session = None,
+                           workers=4,
+                           part_size=8 << 20,
+                           retries=3,
+                           rate_limiter: RateLimiter = None):
+    '''
+    分段并发下载文件，每段失败时只重新下载该段；服务端不支持Range请求时退回download_file
+    @param url: 下载链接
+    @param save_path: 保存路径
+    @param size: 文件大小
+    @param session: requests会话
+    @param workers: 并发下载的分段数
+    @param part_size: 分段大小
+    @param retries: 每段的最大重试次数
+    @param rate_limiter(RateLimiter|None): 限速器
+    '''
+    s = session or Session()
+    if size <= part_size or workers <= 1:
+        return download_file(url, save_path, s, True, size, retries=retries,
+                             rate_limiter=rate_limiter)
 
     with open(save_path, 'wb') as f:
-        for chunk in r.iter_content(chunk_size=1024):
-            if chunk:
-                f.write(chunk)
+        f.truncate(size)
+
+    def fetch(start):
+        end = min(start + part_size, size) - 1
+        for attempt in range(retries + 1):
+            offset = start
+            try:
+                with s.get(url,
+                           stream=True,
+                           headers={'Range': f'bytes={start}-{end}'}) as r:
+                    r.raise_for_status()
+                    if r.status_code != 206:
+                        raise _RangeUnsupported()
+                    with open(save_path, 'r+b') as f:
+                        f.seek(start)
+                        for chunk in r.iter_content(STREAM_CHUNK_SIZE):
+                            if rate_limiter is not None:
+                                rate_limiter.consume(len(chunk))
+                            f.write(chunk)
+                            offset += len(chunk)
+            except (RequestsConnectionError, ChunkedEncodingError):
+                pass
+            if offset == end + 1:
+                return
+        raise IntegrityError(
+            f'{save_path}: 分段 {start}-{end} 下载不完整（{offset - start} 字节）')
+
+    try:
+        with ThreadPoolExecutor(workers) as pool:
+            list(pool.map(fetch, range(0, size, part_size)))
+    except _RangeUnsupported:
+        return download_file(url, save_path, s, True, size, retries=retries,
+                             rate_limiter=rate_limiter)
+
+
+class _RangeUnsupported(Exception):
+    pass
+
+
+def ensure_pool_size(session: Session, size: int):
+    '''
+    确保会话的连接池足够容纳size个并发请求
+    @param session: requests会话
+    @param size: 连接池大小
+    '''
+    for prefix in ('http://', 'https://'):
+        adapter = session.get_adapter(prefix + 'localhost')
+        if getattr(adapter, '_pool_maxsize', 0) < size:
+            session.mount(prefix,
+                          HTTPAdapter(pool_connections=size,
+                                      pool_maxsize=size))
+
+
+def parse_time(value) -> float:
+    '''
+    将Cloudreve返回的ISO 8601时间字符串转换为时间戳
+    @param value: 时间字符串，如2024-01-01T00:00:00.123456789+08:00
+    @return: 时间戳（秒），无法解析时返回0.0
+    '''
+    if not value:
+        return 0.0
+    if isinstance(value, (int, float)):
+        return float(value)
+    m = _TIME_RE.match(value)
+    if not m:
+        return 0.0
+    base, fraction, tz = m.groups()
+    if fraction:
+        base += fraction[:7].ljust(7, '0')
+    if not tz or tz == 'Z':
+        tz = '+00:00'
+    elif ':' not in tz:
+        tz = tz[:3] + ':' + tz[3:]
+    return datetime.fromisoformat(base.replace(' ', 'T') + tz).timestamp()
+
+
+class ChunkReader:
+    '''
+    分块读取本地文件的流水线
+
+    读取线程通过有界队列预读后续分块，可选的校验线程并行计算校验和，
+    上传方只需迭代本对象发送分块，磁盘读取与网络发送得以重叠。
+    内存中最多同时存在约2 * (prefetch + 1)个分块。
+
+        with ChunkReader(path, chunk_size, checksum='md5') as reader:
+            for index, offset, chunk in reader:
+                send(chunk)
+        print(reader.hexdigest())
+    '''
+
+    _END = object()
+
+    def __init__(self,
+                 path,
+                 chunk_size,
+                 prefetch=2,
+                 checksum=None,
+                 rate_limiter: RateLimiter = None):
+        '''
+        @param path: 本地文件路径
+        @param chunk_size: 分块大小
+        @param prefetch: 预读的分块数
+        @param checksum(str|None): hashlib算法名称，如md5、sha256，为None时不计算
+        @param rate_limiter(RateLimiter|None): 限速器，按读取的字节数限制上传速度
+        '''
+        self.path = path
+        self.rate_limiter = rate_limiter
+        self.chunk_size = chunk_size
+        self.prefetch = max(1, prefetch)
+        self.hash = hashlib.new(checksum) if checksum else None
+        self._chunks = Queue(self.prefetch)
+        self._hash_queue = Queue(self.prefetch) if self.hash else None
+        self._stop = threading.Event()
+        self._threads = []
+        self._error = None
+
+    def _put(self, queue: Queue, item) -> bool:
+        while not self._stop.is_set():
+            try:
+                queue.put(item, timeout=0.1)
+                return True
+            except Full:
+                pass
+        return False
+
+    def _read(self):
+        try:
+            with open(self.path, 'rb') as file:
+                index = offset = 0
+                while not self._stop.is_set():
+                    chunk = file.read(self.chunk_size)
+                    if not chunk:
+                        break
+                    if self.rate_limiter is not None:
+                        self.rate_limiter.consume(len(chunk))
+                    if self._hash_queue is not None:
+                        self._put(self._hash_queue, chunk)
+                    self._put(self._chunks, (index, offset, chunk))
+                    index += 1
+                    offset += len(chunk)
+        except Exception as e:
+            self._error = e
+        finally:
+            if self._hash_queue is not None:
+                self._put(self._hash_queue, self._END)
+            self._put(self._chunks, self._END)
+
+    def _digest(self):
+        while True:
+            try:
+                chunk = self._hash_queue.get(timeout=0.1)
+            except Empty:
+                if self._stop.is_set():
+                    return
+                continue
+            if chunk is self._END:
+                return
+            self.hash.update(chunk)
+
+    def _start(self):
+        if self._threads:
+            return
+        self._threads.append(threading.Thread(target=self._read, daemon=True))
+        if self.hash is not None:
+            self._threads.append(
+                threading.Thread(target=self._digest, daemon=True))
+        for thread in self._threads:
+            thread.start()
+
+    def __iter__(self):
+        self._start()
+        while True:
+            item = self._chunks.get()
+            if item is self._END:
+                break
+            yield item
+        if self._error is not None:
+            raise self._error
+        for thread in self._threads:
+            thread.join()
+
+    def hexdigest(self):
+        '''
+        返回校验和（需在迭代完成后调用）
+        '''
+        return self.hash.hexdigest() if self.hash is not None else None
+
+    def close(self):
+        '''
+        停止读取线程（提前结束上传时调用）
+        '''
+        self._stop.set()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
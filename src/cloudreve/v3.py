@@ -1,9 +1,16 @@
+import threading
+import time
 from pathlib import Path
+from typing import Union
 
-from requests import Session, request
+from requests import Response, Session, request
 from urllib.parse import quote_plus
 
-from .utils import download_file
+from .cache import cached_read, invalidates
+from .entries import Entry, Listing, Policy
+from .jsonstream import iter_json_array
+from .utils import (AUTH_ERROR_CODES, STREAM_CHUNK_SIZE, ChunkReader,
+                    IntegrityError, RateLimiter, download_file, json_loads)
 
 
 def generate_src(file_id, is_dir) -> dict:
@@ -18,6 +25,13 @@ def generate_src(file_id, is_dir) -> dict:
     return src
 
 
+def generate_batch_src(items, dirs) -> dict:
+    return {
+        'items': list(items),
+        'dirs': list(dirs),
+    }
+
+
 def revise_file_path(file_path: str) -> str:
     if file_path[0] != '/':
         file_path = '/' + file_path
@@ -28,22 +42,39 @@ def revise_file_path(file_path: str) -> str:
     return file_path
 
 
+def cache_path(path: str) -> str:
+    # 读缓存使用的规范路径，根目录（包括空字符串）为/
+    return revise_file_path(path or '/') or '/'
+
+
 class Cloudreve:
     session: Session
     user: dict
+    # 上传时预读的分块数
+    upload_prefetch: int = 2
+    # 上传时并行计算的校验和算法（hashlib名称），为None时不计算
+    upload_checksum: Union[str, None] = None
+    # 单个分块发送失败时的重试次数
+    upload_retries: int = 0
+    # 上传与下载共用的限速器，为None时不限速
+    rate_limiter: Union[RateLimiter, None] = None
 
     def __init__(self,
                  base_url: str = 'http://127.0.0.1:5212',
                  proxy=None,
                  verify=True,
                  headers=None,
-                 cloudreve_session=None):
+                 cloudreve_session=None,
+                 credential_cache=None,
+                 read_cache=None):
         '''
         @param base_url(str): Cloudreve站点地址
         @param proxy(dict|str|None): 代理
         @param verify(bool): 是否验证ssl证书
         @param headers(dict|None): 自定义请求头
         @param cloudreve_session(str|None): Cloudreve会话ID，提供后可无需调用登录接口
+        @param credential_cache(CredentialCache|None): 登录凭据缓存，提供后login会优先复用缓存中未过期的会话
+        @param read_cache(ReadCache|None): 读接口缓存，提供后list、get_property、get_download_url的并发请求会被合并并短时缓存
         '''
 
         while base_url.endswith('/'):
@@ -64,16 +95,87 @@ class Cloudreve:
                 {'cloudreve-session': cloudreve_session})
         if type(headers) == dict:
             self.session.headers.update(headers)
+        self.credential_cache = credential_cache
+        self.read_cache = read_cache
+        # 使用凭据缓存登录时保存(缓存键, 邮箱, 密码)，凭据被吊销后用于重新登录
+        self._cached_login = None
+        # 每次登录加一，用于判断收到未登录错误后是否已有其他线程重新登录
+        self._login_generation = 0
+        self._login_lock = threading.RLock()
+
+    def send(self, method, url, **kwargs):
+        '''
+        发送原始请求
+        @param method: 请求方法
+        @param url: 接口地址（相对于base_url）
+        @return: requests.Response
+        '''
+        return self.session.request(method, self.base_url + url, **kwargs)
 
     def request(self, method, url, **kwargs):
-        r = self.session.request(method, self.base_url + url, **kwargs)
-        r = r.json()
+        generation = self._login_generation
+        r = self._parse(self.send(method, url, **kwargs))
+        if r['code'] in AUTH_ERROR_CODES and self._recover_login(generation):
+            # 每次调用最多重试一次
+            r = self._parse(self.send(method, url, **kwargs))
 
         if r['code'] != 0:
             raise Exception(f'{r["code"]}: {r["msg"]}')
 
         return r.get('data')
 
+    def stream_request(self, method, url, key, document=None, **kwargs):
+        '''
+        流式请求，在响应下载过程中逐个返回data中指定数组的元素
+        @param method: 请求方法
+        @param url: 接口地址
+        @param key: 数组键名
+        @param document(dict|None): 若提供，迭代结束后填入去掉该数组元素后的完整响应
+        '''
+        document = {} if document is None else document
+        for retried in (False, True):
+            generation = self._login_generation
+            document.clear()
+            with self.send(method, url, stream=True, **kwargs) as r:
+                if r.status_code == 401:
+                    document.update(self._parse(r))
+                else:
+                    yield from iter_json_array(
+                        r.iter_content(STREAM_CHUNK_SIZE), key, document)
+            # 未登录错误的响应中没有数组元素，重新登录后可以直接重新请求（最多一次）
+            if retried or document['code'] not in AUTH_ERROR_CODES or (
+                    not self._recover_login(generation)):
+                break
+
+        if document['code'] != 0:
+            raise Exception(f'{document["code"]}: {document["msg"]}')
+
+    @staticmethod
+    def _parse(r: Response) -> dict:
+        if r.status_code == 401:
+            return {'code': 401, 'msg': 'Unauthorized'}
+        return json_loads(r.content)
+
+    def _recover_login(self, generation) -> bool:
+        '''
+        缓存中的凭据被服务端吊销（如登出、重启、密钥轮换）时，清除该缓存并重新登录
+        @param generation: 发出请求时的登录次数
+        @return: 是否已重新登录，为True时调用方应重试请求
+        '''
+        with self._login_lock:
+            if generation != self._login_generation:
+                # 其他线程已重新登录
+                return True
+            if self._cached_login is None:
+                return False
+            key, email, password = self._cached_login
+            # 重新登录期间的未登录错误不再触发恢复
+            self._cached_login = None
+            with self.credential_cache.lock():
+                self.credential_cache.set(key, None)
+            self.login(email, password)
+            return True
+
     def login(self, email, password):
         '''
         登录（请在执行其他操作前调用此方法）
@@ -81,6 +183,41 @@ class Cloudreve:
         @param password: 密码
         '''
 
+        with self._login_lock:
+            self._cached_login = None
+            cache = self.credential_cache
+            if cache is None:
+                result = self._login(email, password)
+            else:
+                key = f'{self.base_url}|{email}'
+                result = self._login_with_cache(cache, key, email, password)
+                self._cached_login = (key, email, password)
+            self._login_generation += 1
+            return result
+
+    def _login_with_cache(self, cache, key, email, password):
+        with cache.lock():
+            cached = cache.get(key)
+            if cached and cache.valid(cached.get('expires')):
+                self.session.cookies.update(
+                    {'cloudreve-session': cached['session']})
+                self.user = cached['user']
+                return
+
+            self._login(email, password)
+
+            expires = None
+            for cookie in self.session.cookies:
+                if cookie.name == 'cloudreve-session':
+                    expires = cookie.expires
+            cache.set(
+                key, {
+                    'session': self.session.cookies.get('cloudreve-session'),
+                    'user': self.user,
+                    'expires': expires or time.time() + cache.default_ttl,
+                })
+
+    def _login(self, email, password):
         r = self.request('POST',
                          '/user/session',
                          json={
@@ -90,6 +227,7 @@ class Cloudreve:
                          })
         self.user = r
 
+    @cached_read(cache_path)
     def list(self, path='/'):
         '''
         列出目录下的文件
@@ -102,6 +240,19 @@ class Cloudreve:
 
         return self.request('get', '/directory' + quote_plus(path, safe=[]))
 
+    def iter_list(self, path='/', as_entry=False):
+        '''
+        流式列出目录下的文件，适合文件数量极多的目录
+        @param path: 目录路径
+        @param as_entry: 是否返回Entry对象而非原始字典
+        @return: 文件迭代器
+        '''
+
+        for i in self.stream_request('get',
+                                     '/directory' + quote_plus(path, safe=[]),
+                                     'objects'):
+            yield Entry.from_v3(i) if as_entry else i
+
     def get_id(self, file_path: str, return_type=False):
         '''
         根据文件路径获取文件ID
@@ -125,6 +276,40 @@ class Cloudreve:
 
         raise Exception('File not found')
 
+    def list_entries(self, path='/', keep_raw=False) -> Listing:
+        '''
+        列出目录下的文件，返回紧凑的条目对象
+        @param path: 目录路径
+        @param keep_raw: 是否在条目中保留原始字典
+        @return: Listing，迭代得到Entry
+        '''
+
+        r = self.list(path)
+        policy = Policy.from_dict(r['policy'],
+                                  keep_raw) if r.get('policy') else None
+        return Listing(
+            revise_file_path(path) or '/', r['objects'], Entry.from_v3,
+            policy, keep_raw)
+
+    def get_entry(self, file_path, keep_raw=False) -> Entry:
+        '''
+        根据文件路径获取条目
+        @param file_path: 文件路径
+        @param keep_raw: 是否在条目中保留原始字典
+        @return: Entry
+        '''
+
+        file_path = revise_file_path(file_path)
+        dir = file_path[:file_path.rfind('/')]
+        name = file_path[file_path.rfind('/') + 1:]
+
+        for file in self.list(dir)['objects']:
+            if file['name'] == name:
+                return Entry.from_v3(file, keep_raw)
+
+        raise Exception('File not found')
+
+    @cached_read()
     def get_property(self, file_id, is_dir=False, trace_root=False):
         '''
         获取文件属性
@@ -148,6 +333,7 @@ class Cloudreve:
                                 'trace_root': trace_root,
                             })
 
+    @cached_read()
     def get_download_url(self, file_id) -> str:
         '''
         获取文件临时下载链接
@@ -160,14 +346,31 @@ class Cloudreve:
             url = self.base_url + url
         return url
 
-    def download(self, file_id, save_path):
+    def download(self,
+                 file_id,
+                 save_path,
+                 verify=False,
+                 checksum=None,
+                 expected_checksum=None,
+                 resume=False):
         '''
         下载文件至本地
         @param file_id: 文件ID
         @param save_path: 保存路径
-        '''
+        @param verify: 是否按文件属性中的大小校验，数据不完整时只续传缺失的部分
+        @param checksum(str|None): 下载过程中计算的校验和算法（hashlib名称）
+        @param expected_checksum(str|None): 预期的校验和（需同时提供checksum），不一致时抛出IntegrityError
+        @param resume: 保存路径已存在时是否从已有数据之后继续下载
+        @return: 提供checksum时返回校验和
+        '''
+        assert checksum or not expected_checksum, '提供expected_checksum时需同时提供checksum。'
+        expected_size = None
+        if verify:
+            expected_size = self.get_property(file_id)['size']
         download_url = self.get_download_url(file_id)
-        download_file(download_url, save_path, self.session)
+        return download_file(download_url, save_path, self.session, verify,
+                             expected_size, checksum, expected_checksum,
+                             resume=resume, rate_limiter=self.rate_limiter)
 
     def get_source_url(self, file_id, url_only=True):
         '''
@@ -231,6 +434,7 @@ class Cloudreve:
 
         return r
 
+    @invalidates()
     def delete(self, file_id, is_dir=False, force=False, unlink=False):
         '''
         删除文件或文件夹
@@ -248,6 +452,7 @@ class Cloudreve:
 
         self.request('delete', '/object', json=body)
 
+    @invalidates()
     def rename(self, file_id, new_name, is_dir=False):
         '''
         重命名文件或文件夹
@@ -264,6 +469,7 @@ class Cloudreve:
 
         self.request('post', '/object/rename', json=body)
 
+    @invalidates('dst_dir', normalize=cache_path)
     def _copy(self, src_dir, file_id, dst_dir, is_dir=False):
         '''
         通过来源文件夹和文件ID复制文件或文件夹
@@ -295,6 +501,7 @@ class Cloudreve:
 
         self._copy(src_dir, src_file_id, dst_dir, file_type == 'dir')
 
+    @invalidates('src_dir', 'dst_dir', normalize=cache_path)
     def _move(self, src_dir, file_id, dst_dir, is_dir=False):
         '''
         通过来源文件夹和文件ID移动文件或文件夹
@@ -327,6 +534,63 @@ class Cloudreve:
 
         self._move(src_dir, src_file_id, dst_dir, file_type == 'dir')
 
+    @invalidates('dst_dir', normalize=cache_path)
+    def batch_copy(self, src_dir, items, dirs, dst_dir):
+        '''
+        批量复制同一来源文件夹下的文件和文件夹
+        请注意：Cloudreve V3每次只能复制一个对象，items与dirs合计超过一个时服务端会拒绝请求
+        @param src_dir: 来源文件夹
+        @param items: 文件ID列表
+        @param dirs: 文件夹ID列表
+        @param dst_dir: 目标目录
+        '''
+
+        body = {
+            'src_dir': src_dir,
+            'src': generate_batch_src(items, dirs),
+            'dst': dst_dir,
+        }
+
+        self.request('post', '/object/copy', json=body)
+
+    @invalidates('src_dir', 'dst_dir', normalize=cache_path)
+    def batch_move(self, src_dir, items, dirs, dst_dir):
+        '''
+        批量移动同一来源文件夹下的文件和文件夹
+        @param src_dir: 来源文件夹
+        @param items: 文件ID列表
+        @param dirs: 文件夹ID列表
+        @param dst_dir: 目标目录
+        '''
+
+        body = {
+            'action': 'move',
+            'src_dir': src_dir,
+            'src': generate_batch_src(items, dirs),
+            'dst': dst_dir,
+        }
+
+        self.request('patch', '/object', json=body)
+
+    @invalidates()
+    def batch_delete(self, items, dirs, force=False, unlink=False):
+        '''
+        批量删除文件和文件夹
+        @param items: 文件ID列表
+        @param dirs: 文件夹ID列表
+        @param force: 强制删除文件
+        @param unlink: 仅解除链接
+        '''
+
+        body = {
+            'force': force,
+            'unlink': unlink,
+        }
+        body.update(generate_batch_src(items, dirs))
+
+        self.request('delete', '/object', json=body)
+
+    @invalidates('dir_path', normalize=cache_path)
     def create_dir(self, dir_path):
         '''
         创建文件夹
@@ -337,15 +601,27 @@ class Cloudreve:
 
         self.request('put', '/directory', json={'path': dir_path})
 
+    def _chunk_reader(self, local_file: Path, chunk_size) -> ChunkReader:
+        return ChunkReader(local_file, chunk_size, self.upload_prefetch,
+                           self.upload_checksum, self.rate_limiter)
+
+    def _send_chunk(self, send, *args, **kwargs):
+        # 分块发送失败时只重传该分块
+        for attempt in range(self.upload_retries + 1):
+            try:
+                r = send(*args, **kwargs)
+                if isinstance(r, Response):
+                    r.raise_for_status()
+                return r
+            except Exception:
+                if attempt >= self.upload_retries:
+                    raise
+
     def upload_to_local(self, local_file: Path, sessionID, chunkSize, expires):
-        with open(local_file, 'rb') as file:
-            block_id = 0
-            while True:
-                chunk = file.read(chunkSize)
-                if not chunk:
-                    break
-
-                self.request(
+        with self._chunk_reader(local_file, chunkSize) as reader:
+            for block_id, _, chunk in reader:
+                self._send_chunk(
+                    self.request,
                     'post',
                     f'/file/upload/{sessionID}/{block_id}',
                     headers={
@@ -354,27 +630,27 @@ class Cloudreve:
                     },
                     data=chunk,
                 )
-
-                block_id += 1
+        return reader.hexdigest()
 
     def upload_to_onedrive(self, local_file: Path, sessionID, chunkSize,
                            expires, uploadURLs):
         upload_url = uploadURLs[0]
         file_size = local_file.stat().st_size
-        with open(local_file, 'rb') as file:
-            for i in range(0, file_size, chunkSize):
-                start = i
-                end = min(i + chunkSize, file_size) - 1
-                request(
+        with self._chunk_reader(local_file, chunkSize) as reader:
+            for _, start, chunk in reader:
+                end = start + len(chunk) - 1
+                self._send_chunk(
+                    request,
                     'put',
                     upload_url,
                     headers={
                         'Content-Type': 'application/octet-stream',
                         'Content-Range': f'bytes {start}-{end}/{file_size}',
                     },
-                    data=file.read(chunkSize),
+                    data=chunk,
                 )
         self.request('post', f'/callback/onedrive/finish/{sessionID}', json={})
+        return reader.hexdigest()
 
     def upload_to_oss(
         self,
@@ -388,32 +664,45 @@ class Cloudreve:
     ):
         upload_url = uploadURLs[0]
         file_size = local_file.stat().st_size
-        with open(local_file, 'rb') as file:
-            for i in range(0, file_size, chunkSize):
-                start = i
-                end = min(i + chunkSize, file_size) - 1
-                r = request(
+        with self._chunk_reader(local_file, chunkSize) as reader:
+            for _, start, chunk in reader:
+                end = start + len(chunk) - 1
+                r = self._send_chunk(
+                    request,
                     'put',
                     upload_url,
                     headers={
                         'Content-Type': 'application/octet-stream',
                         'Content-Range': f'bytes {start}-{end}/{file_size}',
                     },
-                    data=file.read(chunkSize),
+                    data=chunk,
                 )
         request('post', completeURL)
+        return reader.hexdigest()
 
-    def upload(self,
-               file_path,
-               local_file_path,
-               policy_id=None,
-               policy_type=None):
+    def get_policy(self, dir_path):
         '''
-        上传文件通用方法
+        获取目录的存储策略
+        @param dir_path: 目录路径
+        @return: 存储策略ID, 存储策略类型
+        '''
+
+        policy = self.list(dir_path)['policy']
+        return policy['id'], policy['type']
+
+    @invalidates('file_path', normalize=cache_path)
+    def create_upload_session(self,
+                              file_path,
+                              local_file_path,
+                              policy_id=None,
+                              policy_type=None):
+        '''
+        创建上传会话
         @param file_path: 文件目标路径
         @param local_file_path: 本地文件路径
         @param policy_id: 存储策略ID（可选）
         @param policy_type: 存储策略类型（可选）
+        @return: 上传会话, 存储策略类型
         当且仅当存储策略ID和类型同时存在时参数生效，否则程序将通过list方法获取存储策略信息
         '''
 
@@ -425,34 +714,78 @@ class Cloudreve:
         name = file_path[file_path.rfind('/') + 1:]
 
         if not (policy_id and policy_type):
-            policy = self.list(dir)['policy']
-            policy_id, policy_type = policy['id'], policy['type']
+            policy_id, policy_type = self.get_policy(dir)
 
+        stat = local_file.stat()
         body = {
             'path': dir,
             'name': name,
-            'size': local_file.stat().st_size,
-            'last_modified': int(local_file.stat().st_mtime * 1000),
+            'size': stat.st_size,
+            'last_modified': int(stat.st_mtime * 1000),
             'policy_id': policy_id,
             'mime_type': '',
         }
 
-        r = self.request('put', '/file/upload', json=body)
+        return self.request('put', '/file/upload', json=body), policy_type
+
+    @invalidates()
+    def upload_with_session(self, local_file_path, upload_session,
+                            policy_type):
+        '''
+        使用已创建的上传会话上传文件
+        @param local_file_path: 本地文件路径
+        @param upload_session: create_upload_session返回的上传会话
+        @param policy_type: 存储策略类型
+        @return: 设置了upload_checksum时返回本地文件的校验和
+        '''
+
+        local_file = Path(local_file_path)
 
         if policy_type == 'local':
             return self.upload_to_local(
                 local_file=local_file,
-                **r,
+                **upload_session,
             )
         elif policy_type == 'onedrive':
             return self.upload_to_onedrive(
                 local_file=local_file,
-                **r,
+                **upload_session,
             )
         # elif policy_type == 'oss':
         #     return self.upload_to_oss(
         #         local_file=local_file,
-        #         **r,
+        #         **upload_session,
         #     )
         else:
             raise ValueError(f'存储策略 {policy_type} 暂时不受支持')
+
+    def upload(self,
+               file_path,
+               local_file_path,
+               policy_id=None,
+               policy_type=None,
+               verify=False):
+        '''
+        上传文件通用方法
+        @param file_path: 文件目标路径
+        @param local_file_path: 本地文件路径
+        @param policy_id: 存储策略ID（可选）
+        @param policy_type: 存储策略类型（可选）
+        @param verify: 上传完成后是否核对服务端记录的文件大小，不一致时抛出IntegrityError
+        @return: 设置了upload_checksum时返回本地文件的校验和
+        当且仅当存储策略ID和类型同时存在时参数生效，否则程序将通过list方法获取存储策略信息
+        '''
+
+        upload_session, policy_type = self.create_upload_session(
+            file_path, local_file_path, policy_id, policy_type)
+        r = self.upload_with_session(local_file_path, upload_session,
+                                     policy_type)
+
+        if verify:
+            size = Path(local_file_path).stat().st_size
+            remote_size = self.get_entry(file_path).size
+            if remote_size != size:
+                raise IntegrityError(
+                    f'{file_path}: 本地大小 {size}，服务端大小 {remote_size}')
+
+        return r
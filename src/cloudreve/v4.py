@@ -1,10 +1,16 @@
+import threading
 from mimetypes import guess_type
 from pathlib import Path
 from typing import List, Literal, Union
 
-from requests import Session, request
+from requests import Response, Session, request
 
-from .utils import download_file
+from .cache import cached_read, invalidates
+from .entries import Entry, Listing, Policy
+from .jsonstream import iter_json_array
+from .utils import (AUTH_ERROR_CODES, STREAM_CHUNK_SIZE, ChunkReader,
+                    IntegrityError, RateLimiter, download_file, json_loads,
+                    parse_time)
 
 
 def revise_file_path(file_path: str) -> str:
@@ -28,19 +34,31 @@ class CloudreveV4:
     session: Session
     user: dict
     refresh_token: Union[str, None] = None
+    # 上传时预读的分块数
+    upload_prefetch: int = 2
+    # 上传时并行计算的校验和算法（hashlib名称），为None时不计算
+    upload_checksum: Union[str, None] = None
+    # 单个分块发送失败时的重试次数
+    upload_retries: int = 0
+    # 上传与下载共用的限速器，为None时不限速
+    rate_limiter: Union[RateLimiter, None] = None
 
     def __init__(self,
                  base_url: str = 'http://127.0.0.1:5212',
                  proxy=None,
                  verify=True,
                  headers=None,
-                 cloudreve_session=None):
+                 cloudreve_session=None,
+                 credential_cache=None,
+                 read_cache=None):
         '''
         @param base_url(str): Cloudreve站点地址
         @param proxy(dict|str|None): 代理
         @param verify(bool): 是否验证ssl证书
         @param headers(dict|None): 自定义请求头
         @param cloudreve_session(str|None): Cloudreve会话ID，提供后可无需调用登录接口
+        @param credential_cache(CredentialCache|None): 登录凭据缓存，提供后login会优先复用缓存中未过期的令牌
+        @param read_cache(ReadCache|None): 读接口缓存，提供后list、get_info、get_download_url的并发请求会被合并并短时缓存
         '''
 
         while base_url.endswith('/'):
@@ -61,22 +79,127 @@ class CloudreveV4:
                 {'cloudreve-session': cloudreve_session})
         if type(headers) is dict:
             self.session.headers.update(headers)
+        self.credential_cache = credential_cache
+        self.read_cache = read_cache
+        # 使用凭据缓存登录时保存(缓存键, 邮箱, 密码)，凭据被吊销后用于重新登录
+        self._cached_login = None
+        # 每次登录加一，用于判断收到未登录错误后是否已有其他线程重新登录
+        self._login_generation = 0
+        self._login_lock = threading.RLock()
+
+    def send(self, method, url, **kwargs):
+        '''
+        发送原始请求
+        @param method: 请求方法
+        @param url: 接口地址（相对于base_url）
+        @return: requests.Response
+        '''
+        return self.session.request(method, self.base_url + url, **kwargs)
 
     def request(self, method, url, **kwargs):
-        r = self.session.request(method, self.base_url + url, **kwargs)
-        r = r.json()
+        generation = self._login_generation
+        r = self._parse(self.send(method, url, **kwargs))
+        if r['code'] in AUTH_ERROR_CODES and self._recover_login(generation):
+            # 每次调用最多重试一次
+            r = self._parse(self.send(method, url, **kwargs))
 
         if r['code'] != 0:
             raise Exception(f'{r["code"]}: {r["msg"]}')
 
         return r.get('data')
 
+    def stream_request(self, method, url, key, document=None, **kwargs):
+        '''
+        流式请求，在响应下载过程中逐个返回data中指定数组的元素
+        @param method: 请求方法
+        @param url: 接口地址
+        @param key: 数组键名
+        @param document(dict|None): 若提供，迭代结束后填入去掉该数组元素后的完整响应
+        '''
+        document = {} if document is None else document
+        for retried in (False, True):
+            generation = self._login_generation
+            document.clear()
+            with self.send(method, url, stream=True, **kwargs) as r:
+                if r.status_code == 401:
+                    document.update(self._parse(r))
+                else:
+                    yield from iter_json_array(
+                        r.iter_content(STREAM_CHUNK_SIZE), key, document)
+            # 未登录错误的响应中没有数组元素，重新登录后可以直接重新请求（最多一次）
+            if retried or document['code'] not in AUTH_ERROR_CODES or (
+                    not self._recover_login(generation)):
+                break
+
+        if document['code'] != 0:
+            raise Exception(f'{document["code"]}: {document["msg"]}')
+
+    @staticmethod
+    def _parse(r: Response) -> dict:
+        if r.status_code == 401:
+            return {'code': 401, 'msg': 'Unauthorized'}
+        return json_loads(r.content)
+
+    def _recover_login(self, generation) -> bool:
+        '''
+        缓存中的凭据被服务端吊销（如登出、重启、密钥轮换）时，清除该缓存并重新登录
+        @param generation: 发出请求时的登录次数
+        @return: 是否已重新登录，为True时调用方应重试请求
+        '''
+        with self._login_lock:
+            if generation != self._login_generation:
+                # 其他线程已重新登录
+                return True
+            if self._cached_login is None:
+                return False
+            key, email, password = self._cached_login
+            # 重新登录期间的未登录错误不再触发恢复
+            self._cached_login = None
+            with self.credential_cache.lock():
+                self.credential_cache.set(key, None)
+            self.login(email, password)
+            return True
+
     def login(self, email, password):
         '''
         登录（请在执行其他操作前调用此方法）
         @param email: 邮箱
         @param password: 密码
         '''
+        with self._login_lock:
+            self._cached_login = None
+            cache = self.credential_cache
+            if cache is None:
+                result = self._login(email, password)
+            else:
+                key = f'{self.base_url}|{email}'
+                result = self._login_with_cache(cache, key, email, password)
+                self._cached_login = (key, email, password)
+            self._login_generation += 1
+            return result
+
+    def _login_with_cache(self, cache, key, email, password):
+        with cache.lock():
+            cached = cache.get(key)
+            if cached and cache.valid(cached.get('access_expires')):
+                self.user = cached['user']
+                self._set_token(cached)
+                return
+            if cached and cache.valid(cached.get('refresh_expires')):
+                self.user = cached['user']
+                self.refresh_token = cached['refresh_token']
+                try:
+                    token = self.refresh_access_token()
+                except Exception:
+                    token = None
+                if token is not None:
+                    cache.set(key, self._token_cache_entry(token))
+                    return
+
+            token = self._login(email, password)
+            cache.set(key, self._token_cache_entry(token))
+
+    def _login(self, email, password):
         r = self.request('post',
                          '/session/token',
                          json={
@@ -84,10 +207,41 @@ class CloudreveV4:
                              'password': password,
                          })
         self.user = r['user']
+        self._set_token(r['token'])
+        return r['token']
+
+    def _set_token(self, token):
         self.session.headers.update(
-            {'Authorization': 'Bearer ' + r['token']['access_token']})
-        self.refresh_token = r['token']['refresh_token']
+            {'Authorization': 'Bearer ' + token['access_token']})
+        self.refresh_token = token['refresh_token']
+
+    def _token_cache_entry(self, token) -> dict:
+        refresh_expires = parse_time(token.get('refresh_expires'))
+        return {
+            'user': self.user,
+            'access_token': token['access_token'],
+            'access_expires': parse_time(token.get('access_expires')),
+            'refresh_token': token['refresh_token'],
+            'refresh_expires': refresh_expires,
+            'expires': refresh_expires,
+        }
+
+    def refresh_access_token(self):
+        '''
+        使用刷新令牌获取新的访问令牌
+        @return: 新的令牌信息
+            - access_token: 访问令牌
+            - refresh_token: 刷新令牌
+            - access_expires: 访问令牌过期时间
+            - refresh_expires: 刷新令牌过期时间
+        '''
+        r = self.request('post',
+                         '/session/token/refresh',
+                         json={'refresh_token': self.refresh_token})
+        self._set_token(r)
+        return r
 
+    @cached_read(revise_file_path)
     def list(self,
              uri='/',
              page=0,
@@ -115,46 +269,143 @@ class CloudreveV4:
                                 'next_page_token': next_page_token
                             })
 
-    def get_info(self, file_uri):
+    def iter_list(self,
+                  uri='/',
+                  page_size=1000,
+                  order_by: Literal['name', 'size', 'created_at',
+                                    'updated_at'] = 'created_at',
+                  order: Literal['asc', 'desc'] = 'asc',
+                  as_entry=False):
+        '''
+        流式列出目录下的所有文件，自动翻页，适合文件数量极多的目录
+        @param uri: 目录URI
+        @param page_size: 每页数量
+        @param as_entry: 是否返回Entry对象而非原始字典
+        @return: 文件迭代器
+        '''
+        params = {
+            'uri': revise_file_path(uri),
+            'page': 0,
+            'page_size': page_size,
+            'order_by': order_by,
+            'order': order,
+        }
+        while True:
+            document = {}
+            for i in self.stream_request('get',
+                                         '/file',
+                                         'files',
+                                         document,
+                                         params=params):
+                yield Entry.from_v4(i) if as_entry else i
+
+            pagination = (document.get('data') or {}).get('pagination') or {}
+            if pagination.get('next_token'):
+                params['next_page_token'] = pagination['next_token']
+            elif not pagination.get('is_cursor') and (
+                    params['page'] + 1) * params['page_size'] < pagination.get(
+                        'total_items', 0):
+                params['page'] += 1
+            else:
+                return
+
+    @cached_read(revise_file_path)
+    def get_info(self, file_uri, folder_summary=False):
         '''
         获取文件信息
         @param file_uri: 文件URI
-        @return: 文件信息
+        @param folder_summary: 是否统计文件夹大小（仅对文件夹有效）
+        @return: 文件信息，folder_summary=True时包含folder_summary（size、files、folders）
         '''
-        return self.request('get',
-                            '/file/info',
-                            params={
-                                'uri': revise_file_path(file_uri),
-                                'extended': True
-                            })
+        params = {
+            'uri': revise_file_path(file_uri),
+            'extended': True,
+        }
+        if folder_summary:
+            params['folder_summary'] = True
+        return self.request('get', '/file/info', params=params)
 
     get_property = get_info
 
-    def get_download_url(self, file_uri) -> str:
+    def list_entries(self, uri='/', keep_raw=False, **kwargs) -> Listing:
         '''
-        获取文件临时下载链接
+        列出目录下的文件，返回紧凑的条目对象
+        @param uri: 目录URI
+        @param keep_raw: 是否在条目中保留原始字典
+        @param kwargs: 传递给list方法的分页与排序参数
+        @return: Listing，迭代得到Entry
+        '''
+        r = self.list(uri, **kwargs)
+        policy = Policy.from_dict(
+            r['storage_policy'],
+            keep_raw) if r.get('storage_policy') else None
+        parent = (r.get('parent') or {}).get('path') or revise_file_path(uri)
+        return Listing(parent, r['files'], Entry.from_v4, policy, keep_raw)
+
+    def get_entry(self, file_uri, keep_raw=False) -> Entry:
+        '''
+        获取文件信息，返回紧凑的条目对象
         @param file_uri: 文件URI
-        @return: 下载链接
+        @param keep_raw: 是否在条目中保留原始字典
+        @return: Entry
+        '''
+        return Entry.from_v4(self.get_info(file_uri), keep_raw)
+
+    def get_download_urls(self, uris: List[str]) -> List[str]:
+        '''
+        批量获取文件临时下载链接
+        @param uris: 文件URI列表
+        @return: 下载链接列表，顺序与传入的URI一致
         '''
         r = self.request('post',
                          '/file/url',
                          json={
                              'download': True,
-                             'uris': [file_uri],
+                             'uris': uris_to_list(uris),
                          })
-        url = r['urls'][0]['url']
-        if not url.startswith('http'):
-            url = self.base_url + url
-        return url
+        urls = []
+        for i in r['urls']:
+            url = i['url']
+            if not url.startswith('http'):
+                url = self.base_url + url
+            urls.append(url)
+        return urls
+
+    @cached_read(revise_file_path)
+    def get_download_url(self, file_uri) -> str:
+        '''
+        获取文件临时下载链接
+        @param file_uri: 文件URI
+        @return: 下载链接
+        '''
+        return self.get_download_urls([file_uri])[0]
 
-    def download(self, file_uri, save_path):
+    def download(self,
+                 file_uri,
+                 save_path,
+                 verify=False,
+                 checksum=None,
+                 expected_checksum=None,
+                 resume=False):
         '''
         下载文件至本地
         @param file_uri: 文件URI
         @param save_path: 保存路径
-        '''
-        download_url = self.get_download_url(revise_file_path(file_uri))
-        download_file(download_url, save_path, self.session)
+        @param verify: 是否按文件信息中的大小校验，数据不完整时只续传缺失的部分
+        @param checksum(str|None): 下载过程中计算的校验和算法（hashlib名称）
+        @param expected_checksum(str|None): 预期的校验和（需同时提供checksum），不一致时抛出IntegrityError
+        @param resume: 保存路径已存在时是否从已有数据之后继续下载
+        @return: 提供checksum时返回校验和
+        '''
+        assert checksum or not expected_checksum, '提供expected_checksum时需同时提供checksum。'
+        file_uri = revise_file_path(file_uri)
+        expected_size = None
+        if verify:
+            expected_size = self.get_info(file_uri)['size']
+        download_url = self.get_download_url(file_uri)
+        return download_file(download_url, save_path, self.session, verify,
+                             expected_size, checksum, expected_checksum,
+                             resume=resume, rate_limiter=self.rate_limiter)
 
     def get_source_url(self, uris):
         '''
@@ -201,6 +452,7 @@ class CloudreveV4:
                          })
         return r
 
+    @invalidates('uri', normalize=revise_file_path)
     def _create(self,
                 uri,
                 type: Literal['folder', 'file'],
@@ -237,6 +489,7 @@ class CloudreveV4:
 
     create_dir = create_directory = create_folder
 
+    @invalidates('file_uri', normalize=revise_file_path)
     def update_file_content(self, file_uri, content):
         '''
         更新文本文件内容
@@ -248,6 +501,7 @@ class CloudreveV4:
                             params={'uri': revise_file_path(file_uri)},
                             data=content)
 
+    @invalidates('uris', normalize=revise_file_path)
     def delete(self,
                uris: Union[str | List[str]],
                unlink=False,
@@ -268,6 +522,7 @@ class CloudreveV4:
 
     remove = delete
 
+    @invalidates('uri', normalize=revise_file_path)
     def rename(self, uri: str, new_name: str):
         '''
         重命名文件或文件夹
@@ -281,6 +536,7 @@ class CloudreveV4:
                                 'new_name': new_name
                             })
 
+    @invalidates('uris', 'dst', normalize=revise_file_path)
     def copy_or_move(self, uris, dst, copy=False):
         '''
         通过来源文件夹和文件ID复制文件或文件夹
@@ -312,15 +568,28 @@ class CloudreveV4:
         '''
         return self.copy_or_move(uris, dst, copy=False)
 
+    def _chunk_reader(self, local_file: Path, chunk_size) -> ChunkReader:
+        return ChunkReader(local_file, chunk_size, self.upload_prefetch,
+                           self.upload_checksum, self.rate_limiter)
+
+    def _send_chunk(self, send, *args, **kwargs):
+        # 分块发送失败时只重传该分块
+        for attempt in range(self.upload_retries + 1):
+            try:
+                r = send(*args, **kwargs)
+                if isinstance(r, Response):
+                    r.raise_for_status()
+                return r
+            except Exception:
+                if attempt >= self.upload_retries:
+                    raise
+
     def _upload_to_local(self, local_file: Path, session_id, chunk_size,
                          **kwards):
-        with open(local_file, 'rb') as file:
-            block_id = 0
-            while True:
-                chunk = file.read(chunk_size)
-                if not chunk:
-                    break
-                self.request(
+        with self._chunk_reader(local_file, chunk_size) as reader:
+            for block_id, _, chunk in reader:
+                self._send_chunk(
+                    self.request,
                     'post',
                     f'/file/upload/{session_id}/{block_id}',
                     headers={
@@ -329,7 +598,7 @@ class CloudreveV4:
                     },
                     data=chunk,
                 )
-                block_id += 1
+        return reader.hexdigest()
 
     def _upload_to_remote_direct(self, local_file: Path, session_id,
                                  chunk_size, upload_urls, credential,
@@ -341,40 +610,38 @@ class CloudreveV4:
             'Authorization': credential,
         }
 
-        with open(local_file, 'rb') as file:
-            block_id = 0
-            chunk = file.read(chunk_size)
-            while chunk:
+        with self._chunk_reader(local_file, chunk_size) as reader:
+            for block_id, _, chunk in reader:
                 headers['Content-Length'] = str(len(chunk))
 
-                self.request('post',
-                             base_upload_url,
-                             params={'chunk': block_id},
-                             headers=headers,
-                             data=chunk)
-
-                block_id += 1
-                chunk = file.read(chunk_size)
+                self._send_chunk(self.request,
+                                 'post',
+                                 base_upload_url,
+                                 params={'chunk': block_id},
+                                 headers=headers,
+                                 data=chunk)
+        return reader.hexdigest()
 
     def _upload_to_onedrive(self, local_file: Path, session_id, chunk_size,
                             upload_urls, callback_secret, **kwards):
         upload_url = upload_urls[0]
         file_size = local_file.stat().st_size
-        with open(local_file, 'rb') as file:
-            for i in range(0, file_size, chunk_size):
-                start = i
-                end = min(i + chunk_size, file_size) - 1
-                request(
+        with self._chunk_reader(local_file, chunk_size) as reader:
+            for _, start, chunk in reader:
+                end = start + len(chunk) - 1
+                self._send_chunk(
+                    request,
                     'put',
                     upload_url,
                     headers={
                         'Content-Type': 'application/octet-stream',
                         'Content-Range': f'bytes {start}-{end}/{file_size}',
                     },
-                    data=file.read(chunk_size),
+                    data=chunk,
                 )
         self.request('post',
                      f'/callback/onedrive/{session_id}/{callback_secret}')
+        return reader.hexdigest()
 
     def _upload_to_oss(
         self,
@@ -388,39 +655,52 @@ class CloudreveV4:
     ):
         upload_url = uploadURLs[0]
         file_size = local_file.stat().st_size
-        with open(local_file, 'rb') as file:
-            for i in range(0, file_size, chunkSize):
-                start = i
-                end = min(i + chunkSize, file_size) - 1
-                request(
+        with self._chunk_reader(local_file, chunkSize) as reader:
+            for _, start, chunk in reader:
+                end = start + len(chunk) - 1
+                self._send_chunk(
+                    request,
                     'put',
                     upload_url,
                     headers={
                         'Content-Type': 'application/octet-stream',
                         'Content-Range': f'bytes {start}-{end}/{file_size}',
                     },
-                    data=file.read(chunkSize),
+                    data=chunk,
                 )
         request('post', completeURL)
+        return reader.hexdigest()
 
-    def upload(self, local_file_path, uri):
+    def get_policy(self, dir_uri):
         '''
-        上传文件
+        获取目录的存储策略
+        @param dir_uri: 目录URI
+        @return: 存储策略（包含id和type）
+        '''
+        return self.list(dir_uri)['storage_policy']
+
+    @invalidates('uri', normalize=revise_file_path)
+    def create_upload_session(self, local_file_path, uri, policy=None):
+        '''
+        创建上传会话
         @param local_file_path: 本地文件路径
         @param uri: 文件目标路径（包含文件名）
+        @param policy(dict|None): 存储策略（可选），未提供时通过list方法获取
+        @return: 上传会话, 存储策略类型
         '''
         local_file = Path(local_file_path)
         if not local_file.is_file():
             raise FileNotFoundError(f'{local_file_path} is not a file')
 
         uri = revise_file_path(uri)
-        dir = uri[:uri.rfind('/')]
-        policy = self.list(dir)['storage_policy']
+        if policy is None:
+            policy = self.get_policy(uri[:uri.rfind('/')])
         policy_id, policy_type = policy['id'], policy['type']
 
         mime_type, _ = guess_type(local_file.name)
-        size = local_file.stat().st_size
-        time = int(local_file.stat().st_mtime * 1000)
+        stat = local_file.stat()
+        size = stat.st_size
+        time = int(stat.st_mtime * 1000)
 
         r = self.request('put',
                          '/file/upload',
@@ -431,6 +711,20 @@ class CloudreveV4:
                              'policy_id': policy_id,
                              'mime_type': mime_type
                          })
+        return r, policy_type
+
+    @invalidates()
+    def upload_with_session(self, local_file_path, upload_session,
+                            policy_type):
+        '''
+        使用已创建的上传会话上传文件
+        @param local_file_path: 本地文件路径
+        @param upload_session: create_upload_session返回的上传会话
+        @param policy_type: 存储策略类型
+        @return: 设置了upload_checksum时返回本地文件的校验和
+        '''
+        local_file = Path(local_file_path)
+        r = upload_session
 
         if policy_type == 'remote' and r.get('upload_urls') and len(
                 r['upload_urls']) > 0:
@@ -457,3 +751,25 @@ class CloudreveV4:
         #     )
         else:
             raise ValueError(f'存储策略 {policy_type} 暂时不受支持')
+
+    def upload(self, local_file_path, uri, verify=False):
+        '''
+        上传文件
+        @param local_file_path: 本地文件路径
+        @param uri: 文件目标路径（包含文件名）
+        @param verify: 上传完成后是否核对服务端记录的文件大小，不一致时抛出IntegrityError
+        @return: 设置了upload_checksum时返回本地文件的校验和
+        '''
+        upload_session, policy_type = self.create_upload_session(
+            local_file_path, uri)
+        r = self.upload_with_session(local_file_path, upload_session,
+                                     policy_type)
+
+        if verify:
+            size = Path(local_file_path).stat().st_size
+            remote_size = self.get_info(uri)['size']
+            if remote_size != size:
+                raise IntegrityError(
+                    f'{uri}: 本地大小 {size}，服务端大小 {remote_size}')
+
+        return r
@@ -0,0 +1,60 @@
+import json
+from urllib.parse import unquote_plus
+
+import pytest
+from requests import Response
+
+from cloudreve import Cloudreve
+
+
+class FakeCloudreve(Cloudreve):
+    '''
+    不发出网络请求的V3客户端
+    @param tree(dict): 目录结构，{目录路径: [(名称, 类型, 大小), ...]}
+    '''
+
+    def __init__(self, tree, **kwargs):
+        super().__init__('http://127.0.0.1:5212', **kwargs)
+        self.tree = tree
+        self.calls = []
+
+    @property
+    def listed(self):
+        '''
+        已列出的目录路径
+        '''
+        return [
+            unquote_plus(url[len('/directory'):]) or '/'
+            for method, url in self.calls
+            if method == 'GET' and url.startswith('/directory')
+        ]
+
+    def send(self, method, url, **kwargs):
+        self.calls.append((method.upper(), url))
+        data = None
+        if method.upper() == 'GET' and url.startswith('/directory'):
+            path = unquote_plus(url[len('/directory'):]) or '/'
+            data = {
+                'parent': path,
+                'objects': [{
+                    'id': path.rstrip('/') + '/' + name,
+                    'name': name,
+                    'path': path,
+                    'type': type,
+                    'size': size,
+                    'date': '2024-01-01T00:00:00Z',
+                } for name, type, size in self.tree[path]],
+                'policy': {
+                    'id': 1,
+                    'type': 'local'
+                },
+            }
+        r = Response()
+        r.status_code = 200
+        r._content = json.dumps({'code': 0, 'data': data}).encode()
+        return r
+
+
+@pytest.fixture
+def fake_cloudreve():
+    return FakeCloudreve
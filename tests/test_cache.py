@@ -0,0 +1,20 @@
+from cloudreve.cache import ReadCache
+
+TREE = {'/': [('a.txt', 'file', 5)]}
+
+
+def test_root_level_lookup_with_read_cache(fake_cloudreve):
+    client = fake_cloudreve(TREE, read_cache=ReadCache())
+    assert client.get_id('/a.txt') == '/a.txt'
+    assert client.get_entry('/a.txt').size == 5
+    # 第二次查询命中缓存
+    assert len(client.calls) == 1
+
+
+def test_root_level_write_invalidates_root_listing(fake_cloudreve):
+    client = fake_cloudreve(TREE, read_cache=ReadCache())
+    client.list('/')
+    client.list('/')
+    client.create_dir('/new')
+    client.list('/')
+    assert client.calls.count(('GET', '/directory%2F')) == 2
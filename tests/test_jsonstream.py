@@ -0,0 +1,30 @@
+import json
+
+from cloudreve.jsonstream import iter_json_array
+
+DOCUMENT = {
+    'code': 0,
+    'data': {
+        'files': [1500.0, -2e3, {
+            'name': 'a,]"b'
+        }, 'c', 7, True],
+        'pagination': {
+            'next_token': 'n'
+        },
+    },
+}
+
+
+def test_every_chunk_boundary():
+    raw = json.dumps(DOCUMENT).encode()
+    for i in range(1, len(raw)):
+        document = {}
+        values = list(iter_json_array([raw[:i], raw[i:]], 'files', document))
+        assert values == DOCUMENT['data']['files'], i
+        assert document['data']['pagination'] == {'next_token': 'n'}
+        assert document['data']['files'] == []
+
+
+def test_number_split_across_chunks():
+    chunks = [b'{"code": 0, "files": [1500.', b'0, 12', b'3]}']
+    assert list(iter_json_array(chunks, 'files')) == [1500.0, 123]
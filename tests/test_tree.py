@@ -0,0 +1,38 @@
+from cloudreve import Cloudreve, CloudreveV4
+from cloudreve.entries import Entry
+from cloudreve.tree import TreeOperation
+
+
+def make_entries(parent, count):
+    return [
+        Entry(f'f{i}', f'{i}.txt', f'{parent}/{i}.txt', 1, False, 0, 0)
+        for i in range(count)
+    ]
+
+
+def test_v3_copy_uses_single_object_batches():
+    op = TreeOperation(Cloudreve(), batch_size=100)
+    batches = op.plan('copy', make_entries('/src', 3), '/src', '/dst')
+    assert [len(i.entries) for i in batches] == [1, 1, 1]
+    batches = op.plan('move', make_entries('/src', 3), '/src', '/dst')
+    assert [len(i.entries) for i in batches] == [3]
+
+
+def test_v4_copy_keeps_batches():
+    op = TreeOperation(CloudreveV4(), batch_size=2)
+    batches = op.plan('copy', make_entries('cloudreve://my/src', 3),
+                      '/src', '/dst')
+    assert [len(i.entries) for i in batches] == [2, 1]
+
+
+def test_plan_skips_entries_inside_selected_dirs():
+    op = TreeOperation(CloudreveV4())
+    entries = [
+        Entry('d', 'd', 'cloudreve://my/src/d', 0, True, 0, 0),
+        Entry('e', 'e', 'cloudreve://my/src/d/e', 0, True, 0, 0),
+        Entry('x', 'x.txt', 'cloudreve://my/src/d/e/x.txt', 1, False, 0, 0),
+        Entry('y', 'y.txt', 'cloudreve://my/src/y.txt', 1, False, 0, 0),
+        Entry('z', 'z.txt', 'cloudreve://my/src/dz/z.txt', 1, False, 0, 0),
+    ]
+    batches = op.plan('move', entries, '/src', '/dst')
+    assert sorted(i.id for b in batches for i in b.entries) == ['d', 'y', 'z']
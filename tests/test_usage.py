@@ -0,0 +1,24 @@
+from cloudreve.usage import UsageReporter
+
+TREE = {
+    '/': [('f1', 'file', 10), ('a', 'dir', 0)],
+    '/a': [('f2', 'file', 20), ('b', 'dir', 0)],
+    '/a/b': [('f3', 'file', 30)],
+}
+
+
+def test_root_rollup_includes_nested_folders(fake_cloudreve):
+    usage = UsageReporter(fake_cloudreve(TREE)).report('/')
+    root = usage['/']
+    assert (root.size, root.files, root.folders) == (60, 3, 2)
+    assert (usage['/a'].size, usage['/a'].files) == (50, 2)
+
+
+def test_untrusted_mtime_lists_again(fake_cloudreve):
+    client = fake_cloudreve(TREE)
+    reporter = UsageReporter(client, trust_dir_mtime=False)
+    reporter.report('/')
+    client.tree = dict(TREE, **{'/a/b': [('f3', 'file', 31)]})
+    client.calls.clear()
+    assert reporter.report('/')['/'].size == 61
+    assert sorted(client.listed) == ['/', '/a', '/a/b']